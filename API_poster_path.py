@@ -1,71 +1,209 @@
 import requests
 import csv
 import concurrent.futures
-from requests.adapters import HTTPAdapter
-from requests.exceptions import RetryError
+import os
+import threading
+import time
+import pandas as pd
+
+from instrumentation import instrument, record_error, set_rows
+from tableIO import format_of, read_table, write_table
+from responseCache import ResponseCache
+from tmdbClient import Checkpoint, TMDBClient, run_bounded, truncate_partial_line
+
+API_KEY = os.environ.get('TMDB_API_KEY', '6deed03784cec96e77ab2430599039f6')
+
+# 输出文件的字段
+FIELDNAMES = ['id', 'poster_path', 'title', 'genres']
+
+# 接口响应缓存文件和有效期，环境变量 TMDB_CACHE_FILEPATH 设为空字符串时不使用缓存
+CACHE_FILEPATH = os.environ.get('TMDB_CACHE_FILEPATH', 'tmdb_cache.sqlite')
+CACHE_TTL = 30 * 24 * 3600
+
+# 所有请求共用的客户端，第一次使用时创建
+default_client = None
+default_client_lock = threading.Lock()
+
+# 返回共用的客户端；cache_filepath 只在第一次创建时生效，为空时不使用缓存
+def get_default_client(cache_filepath=CACHE_FILEPATH):
+    global default_client
+    with default_client_lock:
+        if default_client is None:
+            cache = ResponseCache(cache_filepath, ttl=CACHE_TTL) if cache_filepath else None
+            default_client = TMDBClient(API_KEY, language='zh-CN', concurrency=30, cache=cache)
+        return default_client
+
+# 从接口返回的数据中提取需要的字段
+def parse_movie_data(movie_id, movie_data):
+    poster_path = movie_data.get('poster_path', '')
+    poster_path = f"https://image.tmdb.org/t/p/original{poster_path}" if poster_path else ''
+
+    title = movie_data.get('title', '')
+    genres_list = movie_data.get('genres', [])
+    genre_names = "|".join([genre['name'] for genre in genres_list])
+
+    return {
+        'id': movie_id,
+        'poster_path': poster_path,
+        'title': title,
+        'genres': genre_names,
+    }
 
 # 处理相应字段的数据
-def fetch_movie_data(movie_id):
+def fetch_movie_data(movie_id, client=None):
     try:
-        url = f"https://api.themoviedb.org/3/movie/{movie_id}?api_key=6deed03784cec96e77ab2430599039f6&language=zh-CN"
-        
-        session = requests.Session()
-        retry_strategy = HTTPAdapter(max_retries=3)  # 设置最大重试次数为3次
-        session.mount('https://', retry_strategy)
-
-        response = session.get(url, timeout=10)
-        response.raise_for_status()
-        
-        movie_data = response.json()
-
-        poster_path = movie_data.get('poster_path', '')
-        poster_path = f"https://image.tmdb.org/t/p/original{poster_path}" if poster_path else ''
-
-        title = movie_data.get('title', '')
-        genres_list = movie_data.get('genres', [])
-        genre_names = "|".join([genre['name'] for genre in genres_list])
-
-        return {
-            'id': movie_id,
-            'poster_path': poster_path,
-            'title': title,
-            'genres': genre_names,
-        }
-    except RetryError:
-        print(f"Max retries exceeded while fetching movie data for ID {movie_id}")
-        return None
+        client = client or get_default_client()
+        return parse_movie_data(movie_id, client.get_movie(movie_id))
     except Exception as e:
         print(f"Error occurred while fetching movie data for ID {movie_id}: {e}")
+        record_error(e)
         return None
 
-# 获取电影的海报url，中文类别，中文标题
-def get_json_data(movie_ids):
+# 定期打印进度：完成数、吞吐量、错误率和预计剩余时间
+class Progress:
+    def __init__(self, total, interval=10):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.start = self.last = time.monotonic()
+
+    def update(self, error=False):
+        self.done += 1
+        self.errors += error
+        now = time.monotonic()
+        if now - self.last >= self.interval or self.done == self.total:
+            self.last = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.monotonic()) - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float('inf')
+        error_rate = self.errors / self.done * 100 if self.done else 0.0
+        print(f"{self.done}/{self.total} movies, {rate:.1f}/s, errors {self.errors} ({error_rate:.1f}%), ETA {eta:.0f}s")
+
+# 读取已写入输出文件的电影id，用于中断后继续
+def read_written_ids(output_csv_file):
+    if not os.path.exists(output_csv_file):
+        return set()
+    with open(output_csv_file, 'r', newline='', encoding='utf-8') as file:
+        return {row['id'] for row in csv.DictReader(file)}
+
+# 获取电影的海报url，中文类别，中文标题，边请求边分批写入输出文件
+@instrument()
+def get_json_data(movie_ids, output_csv_file, client=None, checkpoint_file=None, batch_size=500, report_interval=10):
+    """
+    并发请求所有电影的数据，并发数由 client.concurrency 决定。
+    同时在途的请求不超过并发数的4倍，结果每 batch_size 条追加写入一次，内存占用与id数量无关。
+
+    参数：
+    - movie_ids: list of str
+        电影id列表。
+    - output_csv_file: str
+        输出文件。扩展名为 .parquet/.arrow 时先流式写入 <输出文件>.partial（csv 格式），
+        全部完成后转换为输出文件并删除 .partial 文件；重新运行时以已有的输出文件为起点。
+    - client: TMDBClient, 可选
+        请求使用的客户端，默认使用共用的客户端。
+    - checkpoint_file: str, 可选
+        记录已完成id的文件，包括接口返回 404 的id。
+        重新运行时跳过 checkpoint 中和输出文件中已有的id；其他错误的id会重新请求。
+    - batch_size: int, 可选
+        每次写入文件的条数。
+    - report_interval: float, 可选
+        打印进度的间隔（秒）。
+
+    返回写入条数 written、失败条数 errors 和跳过条数 skipped；client 使用缓存时还包括缓存命中统计 cache。
+    """
+    client = client or get_default_client()
+    # 列式格式不能追加写入，先写入专用的 .partial 文件，不会覆盖用户已有的同名 csv
+    stream_file = output_csv_file if format_of(output_csv_file) == 'csv' else f"{output_csv_file}.partial"
+    checkpoint = Checkpoint(checkpoint_file) if checkpoint_file else None
+
+    # 返回 (结果, 是否不需要再请求, 异常)；异常在主线程中记录，计入 get_json_data 阶段
+    def fetch(movie_id):
+        try:
+            return parse_movie_data(movie_id, client.get_movie(movie_id)), True, None
+        except requests.HTTPError as e:
+            # 不存在的电影不需要再请求
+            return None, e.response is not None and e.response.status_code == 404, e
+        except Exception as e:
+            return None, False, e
+
+    summary = {'written': 0, 'errors': 0, 'skipped': 0}
     try:
-        movies_data = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=30) as executor:
-            future_to_movie = {executor.submit(fetch_movie_data, movie_id): movie_id for movie_id in movie_ids}
-
-            for future in concurrent.futures.as_completed(future_to_movie):
-                movie_id = future_to_movie[future]
-                try:
-                    movie = future.result()
-                    if movie:
-                        movies_data.append(movie)
-                        print(f"Movie ID: {movie_id}")
-                        print(f"Poster Path: {movie['poster_path']}")
-                        print(f"Title: {movie['title']}")
-                        print(f"Genres: {movie['genres']}")
-                        print("--------------------------------------")
-                except Exception as e:
-                    print(f"Error occurred while fetching movie data for ID {movie_id}: {e}")
-
-        return movies_data
+        if stream_file != output_csv_file and not os.path.exists(stream_file) and os.path.exists(output_csv_file):
+            # 上次运行已完成并转换，以已有的输出为起点继续追加
+            read_table(output_csv_file).to_csv(stream_file, index=False, encoding='utf-8')
+        # 中断时最后一行可能只写了一半
+        truncate_partial_line(stream_file)
+        written_ids = read_written_ids(stream_file)
+        pending = [movie_id for movie_id in movie_ids
+                   if movie_id not in written_ids and not (checkpoint and movie_id in checkpoint)]
+        summary['skipped'] = len(movie_ids) - len(pending)
+        del written_ids
+        progress = Progress(len(pending), report_interval)
+
+        with open(stream_file, 'a', newline='', encoding='utf-8') as file, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=client.concurrency) as executor:
+            writer = csv.DictWriter(file, fieldnames=FIELDNAMES)
+            if file.tell() == 0:
+                writer.writeheader()
+
+            batch = []
+            done_ids = []
+
+            # 先写入文件再记录 checkpoint，保证 checkpoint 中的id一定已经写入
+            def flush():
+                writer.writerows(batch)
+                file.flush()
+                if checkpoint:
+                    checkpoint.mark_many(done_ids)
+                summary['written'] += len(batch)
+                batch.clear()
+                done_ids.clear()
+
+            for movie_id, future in run_bounded(executor, fetch, pending, client.concurrency * 4):
+                movie, done, error = future.result()
+                if movie:
+                    batch.append(movie)
+                else:
+                    summary['errors'] += 1
+                    record_error(error)
+                    print(f"Error occurred while fetching movie data for ID {movie_id}: {error}")
+                if done:
+                    done_ids.append(movie_id)
+                progress.update(error=movie is None)
+
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+
+        if stream_file != output_csv_file:
+            write_table(pd.read_csv(stream_file, dtype=str), output_csv_file)
+            os.remove(stream_file)
+
+        set_rows(rows_out=summary['written'])
+        print(f"Written {summary['written']} movies to {output_csv_file}, "
+              f"{summary['errors']} errors, {summary['skipped']} skipped")
+        if client.cache is not None:
+            summary['cache'] = client.cache.stats()
+            print(f"Cache hits: {summary['cache']['hits']}, misses: {summary['cache']['misses']}")
     except Exception as e:
         print(f"Error occurred during concurrent data fetching: {e}")
+        record_error(e)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    return summary
 
 # 读取movies.csv，获取电影id
+@instrument()
 def read_movie_ids_from_csv(csv_file):
     try:
+        # movies 文件为 parquet/arrow 格式时只读取 id 列
+        if format_of(csv_file) != 'csv':
+            return [str(movie_id) for movie_id in read_table(csv_file, columns=['id'])['id']]
         movie_ids = []
         with open(csv_file, 'r', encoding='utf-8') as file:
             reader = csv.DictReader(file)
@@ -74,25 +212,36 @@ def read_movie_ids_from_csv(csv_file):
         return movie_ids
     except Exception as e:
         print(f"Error occurred while reading movie IDs from CSV file: {e}")
+        record_error(e)
         return []
 
 def write_movie_data_to_csv(movies_data, output_csv_file):
     try:
+        # 输出文件扩展名为 .parquet/.arrow 时写成列式格式
+        if format_of(output_csv_file) != 'csv':
+            write_table(pd.DataFrame(movies_data, columns=FIELDNAMES), output_csv_file)
+            print(f"Data successfully written to {output_csv_file}")
+            return
         with open(output_csv_file, 'w', newline='', encoding='utf-8') as file:
             # writer = csv.DictWriter(file, fieldnames=['id', 'poster_path', 'title', 'genres', 'overview'])
-            writer = csv.DictWriter(file, fieldnames=['id', 'poster_path', 'title', 'genres'])
+            writer = csv.DictWriter(file, fieldnames=FIELDNAMES)
             writer.writeheader()
             for movie_data in movies_data:
                 writer.writerow(movie_data)
         print(f"Data successfully written to {output_csv_file}")
     except Exception as e:
         print(f"Error occurred while writing data to CSV file: {e}")
+        record_error(e)
 
 if __name__ == "__main__":
     input_csv_file = 'movies.csv'
     output_csv_file = 'extra_data.csv'
 
+    # 并发数30，每秒最多40个请求；结果边请求边写入，中断后重新运行会从输出文件和 checkpoint 文件继续
+    # 接口响应缓存30天，重新运行时只请求新增或过期的id
+    cache = ResponseCache(CACHE_FILEPATH, ttl=CACHE_TTL)
+    client = TMDBClient(API_KEY, language='zh-CN', concurrency=30, rate=40, cache=cache)
+
     movie_ids = read_movie_ids_from_csv(input_csv_file)
-    movies_data = get_json_data(movie_ids)
-    if movies_data:
-        write_movie_data_to_csv(movies_data, output_csv_file)
+    get_json_data(movie_ids, output_csv_file, client, checkpoint_file='extra_data.checkpoint')
+    cache.close()
@@ -0,0 +1,469 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dataAnalyse import check_data
+from dataProcessing import (clean_id, concat_datasets, data_processing, handle_credits, handle_keywords,
+                            peak_rss_mb, split_data)
+
+# 性能测试：对比逐行 eval() 解析 json 字段和 jsonParser 批量解析的耗时，并检查输出是否一致；
+# handle_credits 在不同进程数下的耗时；
+# 以及在合成数据集上逐阶段测量整个处理和分析流程的耗时和内存峰值，输出 json 报告
+
+GENRES = ['Animation', 'Comedy', 'Family', 'Adventure', 'Fantasy', 'Romance', 'Drama',
+          'Action', 'Crime', 'Thriller', 'Horror', 'History', 'Science Fiction', 'Mystery']
+JOBS = ['Director', 'Screenplay', 'Producer', 'Editor', 'Original Music Composer',
+        'Director of Photography', 'Casting', 'Executive Producer']
+
+
+# 生成一个随机人名，偶尔带上引号，覆盖 repr 使用双引号和转义的情况
+def random_name(rng):
+    name = f"{rng.choice(['Tom', 'Ann', 'Jean', 'Li', 'Sean'])} {rng.choice(['Hanks', 'Smith', 'Wei', 'Park'])}"
+    roll = rng.random()
+    if roll < 0.05:
+        name = f"{name} O'Neil"
+    elif roll < 0.07:
+        name = f'{name} "Jr" O\'Neil'
+    return name
+
+
+def make_genres(rng):
+    return str([{'id': rng.randint(1, 10000), 'name': g} for g in rng.sample(GENRES, rng.randint(0, 4))])
+
+
+def make_crew(rng):
+    return str([{'credit_id': f"{rng.getrandbits(48):012x}", 'department': 'Crew', 'gender': rng.randint(0, 2),
+                 'id': rng.randint(1, 2000000), 'job': rng.choice(JOBS), 'name': random_name(rng),
+                 'profile_path': None if rng.random() < 0.5 else f"/{rng.getrandbits(32):08x}.jpg"}
+                for _ in range(rng.randint(0, 40))])
+
+
+def make_cast(rng):
+    return str([{'cast_id': i, 'character': random_name(rng), 'credit_id': f"{rng.getrandbits(48):012x}",
+                 'gender': rng.randint(0, 2), 'id': rng.randint(1, 2000000), 'name': random_name(rng),
+                 'order': i, 'profile_path': None}
+                for i in range(rng.randint(0, 30))])
+
+
+# 生成合成的 genres/crew/cast 数据
+def make_frame(rows, seed=0):
+    rng = random.Random(seed)
+    frame = pd.DataFrame({
+        'id': range(rows),
+        'genres': [make_genres(rng) for _ in range(rows)],
+        'crew': [make_crew(rng) for _ in range(rows)],
+        'cast': [make_cast(rng) for _ in range(rows)],
+    })
+    # 模拟空值
+    frame.loc[frame.sample(frac=0.01, random_state=seed).index, ['crew', 'cast']] = float('nan')
+    return frame
+
+
+# 改造前的实现：逐行 eval
+def legacy_handle_credits(input_df):
+    director_list = []
+    actor_list = []
+    character_list = []
+    for crew_data in input_df['crew']:
+        if pd.notnull(crew_data):
+            crew_data = eval(crew_data)
+            directors = [member['name'] for member in crew_data if member.get('job') == 'Director']
+            director_list.append('|'.join(directors) if directors else '')
+        else:
+            director_list.append('')
+    for cast_data in input_df['cast']:
+        if pd.notnull(cast_data):
+            cast_data = eval(cast_data)
+            actor_list.append('|'.join([member['name'] for member in cast_data[:15]]))
+            character_list.append('|'.join([member['character'] for member in cast_data[:15]]))
+        else:
+            actor_list.append('')
+            character_list.append('')
+    input_df['director'] = director_list
+    input_df['actor'] = actor_list
+    input_df['character'] = character_list
+    return input_df.drop(['crew', 'cast'], axis=1)
+
+
+def legacy_split_data(data, columns):
+    for column in columns:
+        data[column] = data[column].apply(lambda x: [] if pd.isna(x) else [entry['name'] for entry in eval(str(x))])
+        data[column] = data[column].apply(lambda x: '|'.join(x))
+
+
+def run_legacy(frame):
+    frame = legacy_handle_credits(frame.copy())
+    legacy_split_data(frame, ['genres'])
+    return frame
+
+
+def run_parser(frame):
+    frame = handle_credits(frame.copy())
+    split_data(frame, ['genres'])
+    return frame
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_parser(frame):
+    legacy, legacy_seconds = timed(run_legacy, frame)
+    parsed, parser_seconds = timed(run_parser, frame)
+    identical = legacy.to_csv(index=False) == parsed.to_csv(index=False)
+
+    print(f"rows: {len(frame)}")
+    print(f"eval():     {legacy_seconds:.3f}s")
+    print(f"jsonParser: {parser_seconds:.3f}s")
+    print(f"speedup:    {legacy_seconds / parser_seconds:.1f}x")
+    print(f"identical output: {identical}")
+    return identical
+
+
+# handle_credits 使用 1 到 max_workers 个进程时的耗时和加速比
+def benchmark_workers(frame, max_workers):
+    counts = sorted({1, max_workers} | {2 ** i for i in range(max_workers.bit_length()) if 2 ** i <= max_workers})
+    baseline = None
+    expected = None
+    for workers in counts:
+        result, seconds = timed(handle_credits, frame.copy(), workers)
+        baseline = baseline or seconds
+        csv_text = result.to_csv(index=False)
+        expected = expected or csv_text
+        print(f"workers={workers:<3} {seconds:.3f}s  speedup {baseline / seconds:.2f}x  "
+              f"identical output: {csv_text == expected}")
+
+
+# ---------------------------------------------------------------------------
+# 合成数据集：movies_metadata.csv、credits.csv、keywords.csv、ratings.csv
+# json 字段从预先生成的样本池中随机抽取，生成千万行数据时也只需要按块写出
+# ---------------------------------------------------------------------------
+
+LANGUAGES = ['en', 'fr', 'it', 'ja', 'de', 'es', 'ru', 'zh', 'ko', 'hi']
+COUNTRIES = [('US', 'United States of America'), ('GB', 'United Kingdom'), ('FR', 'France'),
+             ('DE', 'Germany'), ('JP', 'Japan'), ('CN', 'China'), ('IN', 'India'), ('IT', 'Italy')]
+STATUSES = ['Released', 'Released', 'Released', 'Released', 'Rumored', 'Post Production', 'In Production']
+POOL_SIZE = 5000
+
+
+def make_companies(rng):
+    return str([{'name': f"Company {rng.randint(1, 3000)}", 'id': rng.randint(1, 100000)}
+                for _ in range(rng.randint(0, 4))])
+
+
+def make_countries(rng):
+    return str([{'iso_3166_1': code, 'name': name} for code, name in rng.sample(COUNTRIES, rng.randint(0, 2))])
+
+
+def make_languages(rng):
+    return str([{'iso_639_1': code, 'name': code.upper()} for code in rng.sample(LANGUAGES, rng.randint(0, 3))])
+
+
+def make_keywords(rng):
+    return str([{'id': rng.randint(1, 200000), 'name': f"keyword {rng.randint(1, 20000)}"}
+                for _ in range(rng.randint(0, 12))])
+
+
+# 各个 json 字段的样本池
+def make_pools(seed):
+    rng = random.Random(seed)
+    makers = {'genres': make_genres, 'production_companies': make_companies, 'production_countries': make_countries,
+              'spoken_languages': make_languages, 'crew': make_crew, 'cast': make_cast, 'keywords': make_keywords}
+    return {name: np.array([maker(rng) for _ in range(POOL_SIZE)], dtype=object) for name, maker in makers.items()}
+
+
+# 原始数据中错位的异常行：adult 列是一段文字，id 列是日期
+def malformed_row(index):
+    return {'adult': ' - Written by Ørnås', 'belongs_to_collection': " Rune Balot goes to a casino", 'budget': '/ff9qCepilowshEtG2GYWwzt2bs4.jpg',
+            'genres': '0', 'id': f"1997-08-{index % 28 + 1:02d}", 'imdb_id': '0', 'original_language': '104.0'}
+
+
+def make_metadata_chunk(start, size, pools, rng, duplicate_rate, malformed_rate):
+    ids = np.arange(start + 1, start + size + 1).astype(object)
+    # 重复 id：复制本块中前面某一行的 id
+    duplicates = np.flatnonzero(rng.random(size) < duplicate_rate)
+    duplicates = duplicates[duplicates > 0]
+    ids[duplicates] = ids[rng.integers(0, duplicates)]
+
+    def pick(name):
+        return pools[name][rng.integers(0, POOL_SIZE, size)]
+
+    chunk = pd.DataFrame({
+        'adult': 'False',
+        'belongs_to_collection': np.where(rng.random(size) < 0.1, "{'id': 10194, 'name': 'Toy Story Collection'}", ''),
+        'budget': rng.integers(0, 200000000, size),
+        'genres': pick('genres'),
+        'homepage': np.where(rng.random(size) < 0.2, 'http://example.com', ''),
+        'id': ids,
+        'imdb_id': [f"tt{i:07d}" for i in range(start + 1, start + size + 1)],
+        'original_language': np.array(LANGUAGES)[rng.integers(0, len(LANGUAGES), size)],
+        'original_title': [f"Title {i}" for i in range(start + 1, start + size + 1)],
+        'overview': [f"A synthetic overview, with \"quotes\", for movie {i}." for i in range(start + 1, start + size + 1)],
+        'popularity': rng.exponential(3.0, size).round(6),
+        'poster_path': [f"/{value:08x}.jpg" for value in rng.integers(0, 2 ** 32, size)],
+        'production_companies': pick('production_companies'),
+        'production_countries': pick('production_countries'),
+        'release_date': (np.datetime64('1900-01-01') + rng.integers(0, 44000, size)).astype(str),
+        'revenue': rng.integers(0, 1000000000, size).astype(float),
+        'runtime': rng.integers(0, 240, size).astype(float),
+        'spoken_languages': pick('spoken_languages'),
+        'status': np.array(STATUSES)[rng.integers(0, len(STATUSES), size)],
+        'tagline': '',
+        'title': [f"Title {i}" for i in range(start + 1, start + size + 1)],
+        'video': 'False',
+        'vote_average': rng.integers(0, 101, size) / 10,
+        'vote_count': rng.integers(0, 15000, size).astype(float),
+    })
+    malformed = np.flatnonzero(rng.random(size) < malformed_rate)
+    if len(malformed):
+        columns = list(malformed_row(0))
+        chunk[columns] = chunk[columns].astype(object)
+    for row in malformed:
+        for column, value in malformed_row(start + row).items():
+            chunk.at[row, column] = value
+    return chunk
+
+
+def make_ratings_chunk(size, movies, rng):
+    return pd.DataFrame({
+        'userId': rng.integers(1, max(size // 100, 2), size),
+        # 约10%的评分对应的电影不在 movies 中，对齐时会被删除
+        'movieId': rng.integers(1, int(movies * 1.1) + 2, size),
+        'rating': rng.integers(1, 11, size) / 2,
+        'timestamp': rng.integers(789652009, 1501829870, size),
+    })
+
+
+def write_dataset(output_dir, rows, ratings=None, seed=0, duplicate_rate=0.0007, malformed_rate=0.0001,
+                  chunksize=100000):
+    """
+    生成合成的 movies_metadata.csv、credits.csv、keywords.csv 和 ratings.csv，写入 output_dir。
+    三个电影文件按行对齐（concat_datasets 按行号拼接），包含重复 id 和错位的异常行。
+
+    参数：
+    - rows: int
+        电影数量。
+    - ratings: int, 可选
+        评分数量，默认为电影数量的10倍。
+    - seed: int, 可选
+        随机种子，相同参数生成的数据完全相同。
+    - duplicate_rate, malformed_rate: float, 可选
+        重复 id 行和异常行所占的比例。
+
+    参数和之前生成的数据集相同时直接复用，返回数据集的描述。
+    """
+    ratings = rows * 10 if ratings is None else ratings
+    spec = {'rows': rows, 'ratings': ratings, 'seed': seed,
+            'duplicate_rate': duplicate_rate, 'malformed_rate': malformed_rate}
+    spec_filepath = os.path.join(output_dir, 'dataset.json')
+    if os.path.exists(spec_filepath):
+        with open(spec_filepath, 'r', encoding='utf-8') as file:
+            if json.load(file) == spec:
+                return spec
+
+    os.makedirs(output_dir, exist_ok=True)
+    pools = make_pools(seed)
+    rng = np.random.default_rng(seed)
+    files = {name: os.path.join(output_dir, f"{name}.csv")
+             for name in ('movies_metadata', 'credits', 'keywords', 'ratings')}
+
+    for start in range(0, rows, chunksize):
+        size = min(chunksize, rows - start)
+        metadata = make_metadata_chunk(start, size, pools, rng, duplicate_rate, malformed_rate)
+        ids = metadata['id']
+        credits = pd.DataFrame({'cast': pools['cast'][rng.integers(0, POOL_SIZE, size)],
+                                'crew': pools['crew'][rng.integers(0, POOL_SIZE, size)], 'id': ids})
+        keywords = pd.DataFrame({'id': ids, 'keywords': pools['keywords'][rng.integers(0, POOL_SIZE, size)]})
+        # 模拟空值
+        credits.loc[rng.random(size) < 0.01, ['cast', 'crew']] = np.nan
+
+        header = start == 0
+        mode = 'w' if header else 'a'
+        metadata.to_csv(files['movies_metadata'], index=False, header=header, mode=mode)
+        credits.to_csv(files['credits'], index=False, header=header, mode=mode)
+        keywords.to_csv(files['keywords'], index=False, header=header, mode=mode)
+
+    for start in range(0, max(ratings, 1), chunksize * 10):
+        size = min(chunksize * 10, ratings - start)
+        make_ratings_chunk(size, rows, rng).to_csv(files['ratings'], index=False, header=start == 0,
+                                                   mode='w' if start == 0 else 'a')
+
+    with open(spec_filepath, 'w', encoding='utf-8') as file:
+        json.dump(spec, file)
+    return spec
+
+
+# ---------------------------------------------------------------------------
+# 逐阶段测量：每个阶段在新的子进程中运行，内存峰值不受前面阶段的影响
+# ---------------------------------------------------------------------------
+
+ANALYSE_COLUMNS = ['genres', 'production_countries', 'production_companies', 'spoken_languages', 'director', 'actor']
+
+
+def count_rows(filepath):
+    return len(pd.read_csv(filepath, usecols=[0], dtype=str)) if os.path.exists(filepath) else 0
+
+
+# 每个阶段返回 (要计时的函数, 参数, 输入行数, 输出文件)；准备数据的时间不计入
+def stage_concat(workers):
+    return concat_datasets, ("./movies_metadata.csv", "./credits.csv"), count_rows("./movies_metadata.csv"), "./movies.csv"
+
+
+def stage_credits(workers):
+    credits = pd.read_csv("./credits.csv")
+    return handle_credits, (credits, workers), len(credits), None
+
+
+def stage_processing(workers):
+    return (data_processing, ("./movies.csv", "./movies_processed.csv", "./poster_path.csv"),
+            count_rows("./movies.csv"), "./movies_processed.csv")
+
+
+def stage_keywords(workers):
+    return (handle_keywords, ("./keywords.csv", "./keywords_processed.csv", workers),
+            count_rows("./keywords.csv"), "./keywords_processed.csv")
+
+
+def stage_clean_id(workers):
+    return (clean_id, ("./movies_processed.csv", "./ratings.csv", "./ratings_aligned.csv", "movieId"),
+            count_rows("./ratings.csv"), "./ratings_aligned.csv")
+
+
+def stage_check_data(workers):
+    return check_data, ("./movies_processed.csv", ANALYSE_COLUMNS), count_rows("./movies_processed.csv"), None
+
+
+# 按执行顺序排列，后面的阶段读取前面阶段的输出
+STAGES = {
+    'concat_datasets': stage_concat,
+    'handle_credits': stage_credits,
+    'data_processing': stage_processing,
+    'handle_keywords': stage_keywords,
+    'clean_id': stage_clean_id,
+    'check_data': stage_check_data,
+}
+
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+# 在子进程中运行一个阶段，返回耗时、CPU时间、内存峰值和行数
+def profile_stage(name, data_dir, workers):
+    os.chdir(data_dir)
+    func, args, rows_in, output = STAGES[name](workers)
+    setup_mb = peak_rss_mb()
+
+    # 各个函数会打印大量信息，测量时丢弃
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        wall = time.perf_counter()
+        cpu = cpu_seconds()
+        result = func(*args)
+        cpu = cpu_seconds() - cpu
+        wall = time.perf_counter() - wall
+
+    rows_out = len(result) if isinstance(result, pd.DataFrame) else count_rows(output) if output else None
+    return {'wall_seconds': round(wall, 4), 'cpu_seconds': round(cpu, 4), 'peak_mb': round(peak_rss_mb(), 1),
+            'setup_peak_mb': round(setup_mb, 1), 'rows_in': rows_in, 'rows_out': rows_out}
+
+
+def run_suite(data_dir, rows, ratings=None, seed=0, workers=1, stages=None, repeat=1):
+    """
+    生成（或复用）合成数据集，依次测量每个阶段，返回报告。
+    repeat > 1 时每个阶段运行多次，取耗时最短的一次。
+    """
+    # 子进程会继承父进程的内存峰值，数据集也在子进程中生成，使父进程保持很小的内存占用
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        spec = executor.submit(write_dataset, data_dir, rows, ratings, seed).result()
+    generate_seconds = time.perf_counter() - start
+
+    report = {
+        'dataset': spec,
+        'generate_seconds': round(generate_seconds, 3),
+        'workers': workers,
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                        'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'stages': {},
+    }
+    for name in stages or STAGES:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(profile_stage, name, os.path.abspath(data_dir), workers).result())
+        report['stages'][name] = min(runs, key=lambda run: run['wall_seconds'])
+        stats = report['stages'][name]
+        print(f"{name:<18}{stats['wall_seconds']:>9.3f}s  cpu {stats['cpu_seconds']:>9.3f}s  "
+              f"peak {stats['peak_mb']:>8.1f} MB  rows {stats['rows_in']} -> {stats['rows_out']}")
+    return report
+
+
+# 与基准报告对比，耗时或内存峰值超过基准 (1 + tolerance) 倍的阶段视为性能回退
+def compare_reports(report, baseline, tolerance=0.2):
+    regressions = []
+    if report['dataset'] != baseline.get('dataset'):
+        print("Warning: baseline was generated with a different dataset:", baseline.get('dataset'))
+    for name, stats in report['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if base is None:
+            continue
+        for metric in ('wall_seconds', 'peak_mb'):
+            if base[metric] and stats[metric] > base[metric] * (1 + tolerance):
+                regressions.append({'stage': name, 'metric': metric, 'baseline': base[metric], 'current': stats[metric]})
+                print(f"Regression: {name} {metric} {base[metric]} -> {stats[metric]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比 eval() 和 jsonParser 解析 json 字段的性能")
+    parser.add_argument('--rows', type=int, default=10000, help="合成数据的行数")
+    parser.add_argument('--movies', help="使用 concat_datasets 生成的 movies.csv 代替合成数据")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="测试 handle_credits 从1个进程到指定进程数的扩展性，0 表示不测试，-1 表示使用全部CPU")
+    parser.add_argument('--suite', action='store_true',
+                        help="在合成数据集上逐阶段测量整个流程，而不是只对比 json 解析")
+    parser.add_argument('--ratings', type=int, help="合成评分数据的行数，默认为电影数量的10倍")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default="./benchmark_data", help="合成数据集和中间结果的目录")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), help="只测量这些阶段")
+    parser.add_argument('--repeat', type=int, default=1, help="每个阶段运行的次数，取最快的一次")
+    parser.add_argument('--report', help="json 报告的输出路径")
+    parser.add_argument('--baseline', help="与之对比的基准 json 报告，有性能回退时返回非零退出码")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的性能波动比例")
+    args = parser.parse_args()
+
+    if args.suite:
+        workers = os.cpu_count() if args.workers < 0 else max(args.workers, 1)
+        data_dir = os.path.join(args.data_dir, f"rows_{args.rows}")
+        report = run_suite(data_dir, args.rows, args.ratings, args.seed, workers, args.stages, args.repeat)
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as file:
+                report['regressions'] = compare_reports(report, json.load(file), args.tolerance)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        sys.exit(1 if report.get('regressions') else 0)
+
+    if args.movies:
+        data = pd.read_csv(args.movies, low_memory=False)[['id', 'genres', 'crew', 'cast']]
+    else:
+        data = make_frame(args.rows)
+    benchmark_parser(data)
+    if args.workers:
+        benchmark_workers(data, os.cpu_count() if args.workers < 0 else args.workers)
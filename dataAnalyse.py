@@ -1,76 +1,67 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 import ast
 import numpy as np
 
-# 分析电影数据集，包括movie_metadata.csv, keywords.csv, ratings.csv, credits.csv
-
-# 提取adults、status、video字段的具体取值情况
-def check_values(metadata):
-    print("Values of 'adult' column:")
-    print(metadata['adult'].value_counts())
-
-    print("\nValues of 'status' column:")
-    print(metadata['status'].value_counts())
-
-    print("\nValues of 'video' column:")
-    print(metadata['video'].value_counts())
-
-    # 获取 'adult' 字段的具体取值情况
-    adult_values = metadata['adult'].value_counts()
-
-    # 绘制 'adult' 字段的柱状图
-    plt.figure(figsize=(8, 6))
-    adult_values.plot(kind='bar', color='skyblue')
-    plt.title('Values of "adult" column')
-    plt.xlabel('Values')
-    plt.ylabel('Frequency')
-    plt.xticks(rotation=45)
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.tight_layout()
-    plt.show()
+from instrumentation import instrument, set_rows
+from tableIO import read_table
 
-    # 获取 'status' 字段的具体取值情况
-    status_values = metadata['status'].value_counts()
+# 分析电影数据集，包括movie_metadata.csv, keywords.csv, ratings.csv, credits.csv
 
-    # 绘制 'status' 字段的柱状图
-    plt.figure(figsize=(8, 6))
-    status_values.plot(kind='bar', color='lightgreen')
-    plt.title('Values of "status" column')
-    plt.xlabel('Values')
-    plt.ylabel('Frequency')
-    plt.xticks(rotation=45)
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.tight_layout()
-    plt.show()
+# 需要统计取值情况的字段
+VALUE_COLUMNS = ['adult', 'status', 'video']
+VALUE_COLORS = {'adult': 'skyblue', 'status': 'lightgreen', 'video': 'lightcoral'}
 
-    # 获取 'video' 字段的具体取值情况
-    video_values = metadata['video'].value_counts()
+# 统计量的计算：交互模式和报告模式共用，图表和 CSV 使用同一份结果
 
-    # 绘制 'video' 字段的柱状图
+# 各字段的类型、缺省值数量和缺省值占比
+def null_info(metadata):
+    tab_info = pd.DataFrame(metadata.dtypes).T.rename(index={0: 'column type'})
+    nulls = metadata.isnull().sum()
+    tab_info = pd.concat([tab_info, pd.DataFrame(nulls).T.rename(index={0: 'null values'})])
+    tab_info = pd.concat([tab_info, pd.DataFrame(nulls / metadata.shape[0] * 100).T.rename(index={0: 'null values (%)'})])
+    return tab_info
+
+# 播放时长的直方图和频率表，以及不同语言的电影数量（只统计播放时长不超过780分钟的电影）
+def runtime_language_counts(metadata):
+    runtime = pd.to_numeric(metadata['runtime'], errors='coerce')
+    limited = runtime <= 780
+    runtime = runtime[limited]
+    hist_counts, hist_edges = np.histogram(runtime.dropna(), bins=30)
+    return {
+        'runtime_hist': (hist_counts, hist_edges),
+        'runtime_counts': runtime.value_counts().rename_axis('Runtime').reset_index(name='Count'),
+        'language_counts': metadata.loc[limited, 'original_language'].value_counts()
+            .rename_axis('Original Language').reset_index(name='Count'),
+    }
+
+# 一次计算所有图表和表格需要的统计量
+def aggregate_metadata(metadata):
+    aggregates = {f"{column}_values": metadata[column].value_counts() for column in VALUE_COLUMNS}
+    aggregates['null_info'] = null_info(metadata)
+    aggregates.update(runtime_language_counts(metadata))
+    return aggregates
+
+# 绘图：每个函数在一个新的 figure 上绘制，不调用 plt.show()，由调用方决定显示还是保存
+
+def plot_values(values, column):
     plt.figure(figsize=(8, 6))
-    video_values.plot(kind='bar', color='lightcoral')
-    plt.title('Values of "video" column')
+    values.plot(kind='bar', color=VALUE_COLORS.get(column, 'skyblue'))
+    plt.title(f'Values of "{column}" column')
     plt.xlabel('Values')
     plt.ylabel('Frequency')
     plt.xticks(rotation=45)
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.tight_layout()
-    plt.show()
-
-# 查看各字段的值结构和缺省值情况
-def check_nullValues(metadata):
-
-    # 获取变量类型和缺失值信息
-    tab_info = pd.DataFrame(metadata.dtypes).T.rename(index={0: 'column type'})
-    tab_info = pd.concat([tab_info, pd.DataFrame(metadata.isnull().sum()).T.rename(index={0: 'null values'})])
-    tab_info = pd.concat([tab_info, pd.DataFrame(metadata.isnull().sum() / metadata.shape[0] * 100).T.
-                         rename(index={0: 'null values (%)'})])
-    
-    # 保存为CSV文件
-    tab_info.to_csv('metadata_info.csv')
 
-    # 绘制缺省值数量柱状图
+# 绘制缺省值数量柱状图
+def plot_null_count(tab_info):
     plt.figure(figsize=(10, 6))
     ax1 = tab_info.iloc[1].plot(kind='bar', color='blue', alpha=0.7, label='Null Values')
     plt.ylabel('Number of Null Values')
@@ -84,9 +75,9 @@ def check_nullValues(metadata):
         plt.text(i.get_x() + i.get_width() / 2, i.get_height() + 0.1, str(int(i.get_height())), ha='center')
 
     plt.tight_layout()
-    plt.show()
 
-    # 绘制缺省值占比柱状图
+# 绘制缺省值占比柱状图
+def plot_null_percent(tab_info):
     plt.figure(figsize=(10, 6))
     ax2 = tab_info.iloc[2].plot(kind='bar', color='orange', alpha=0.7, label='Null Values (%)')
     plt.ylabel('Percentage of Null Values (%)')
@@ -100,44 +91,173 @@ def check_nullValues(metadata):
         plt.text(i.get_x() + i.get_width() / 2, i.get_height() + 0.1, f"{i.get_height():.2f}%", ha='center')
 
     plt.tight_layout()
-    plt.show()
-
-def time_language_histogram(metadata):
-    # 限制电影播放时长(runtime)的范围
-    metadata = metadata[metadata['runtime'] <= 780]
 
-    # 绘制电影播放时长(runtime)的直方图
+# 绘制电影播放时长(runtime)的直方图，使用预先计算好的分桶
+def plot_runtime(runtime_hist):
+    counts, edges = runtime_hist
     plt.figure(figsize=(10, 6))
-    plt.hist(metadata['runtime'].dropna(), bins=30, color='skyblue', edgecolor='black')
+    plt.bar(edges[:-1], counts, width=np.diff(edges), align='edge', color='skyblue', edgecolor='black')
     plt.xlabel('Runtime')
     plt.ylabel('Frequency')
     plt.title('Histogram of Movie Runtime')
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.tight_layout()
-    plt.show()
 
-    # 绘制不同语言电影数量(original_language)的直方图
+# 绘制不同语言电影数量(original_language)的直方图
+def plot_languages(language_counts):
     plt.figure(figsize=(10, 6))
-    metadata['original_language'].value_counts().plot(kind='bar', color='lightgreen')
+    language_counts.set_index('Original Language')['Count'].plot(kind='bar', color='lightgreen')
     plt.xlabel('Original Language')
     plt.ylabel('Number of Movies')
     plt.title('Histogram of Number of Movies by Original Language')
     plt.xticks(rotation=45)
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.tight_layout()
+
+# 提取adults、status、video字段的具体取值情况
+def check_values(metadata):
+    for column in VALUE_COLUMNS:
+        values = metadata[column].value_counts()
+        print(f"\nValues of '{column}' column:")
+        print(values)
+
+        # 绘制字段的柱状图
+        plot_values(values, column)
+        plt.show()
+
+# 查看各字段的值结构和缺省值情况
+def check_nullValues(metadata):
+
+    # 获取变量类型和缺失值信息
+    tab_info = null_info(metadata)
+    
+    # 保存为CSV文件
+    tab_info.to_csv('metadata_info.csv')
+
+    plot_null_count(tab_info)
     plt.show()
 
-    # 打印每个具体值的频率表格
-    runtime_counts = metadata['runtime'].value_counts().reset_index().rename(columns={'index': 'Runtime', 'runtime': 'Count'})
-    language_counts = metadata['original_language'].value_counts().reset_index().rename(columns={'index': 'Original Language', 'original_language': 'Count'})
+    plot_null_percent(tab_info)
+    plt.show()
 
-    # 将数据导出为CSV文件
-    runtime_counts.to_csv('runtime_counts.csv', index=False)
-    language_counts.to_csv('language_counts.csv', index=False)
+def time_language_histogram(metadata):
+    counts = runtime_language_counts(metadata)
 
-# 分析源数据
+    plot_runtime(counts['runtime_hist'])
+    plt.show()
+
+    plot_languages(counts['language_counts'])
+    plt.show()
+
+    # 将每个具体值的频率表格导出为CSV文件
+    counts['runtime_counts'].to_csv('runtime_counts.csv', index=False)
+    counts['language_counts'].to_csv('language_counts.csv', index=False)
+
+# 报告模式：不弹出窗口，把所有图表保存为 PNG，统计量按输入文件的指纹缓存
+
+# 图表文件名 -> (绘图函数, 使用的统计量, 额外参数)
+CHARTS = {
+    'adult.png': (plot_values, 'adult_values', ('adult',)),
+    'status.png': (plot_values, 'status_values', ('status',)),
+    'video.png': (plot_values, 'video_values', ('video',)),
+    'metadata_nullcount.png': (plot_null_count, 'null_info', ()),
+    'metadata_nullpercentage.png': (plot_null_percent, 'null_info', ()),
+    'runtime.png': (plot_runtime, 'runtime_hist', ()),
+    'origin_language.png': (plot_languages, 'language_counts', ()),
+}
+
+# 统计量导出的 CSV 文件
+TABLES = {
+    'metadata_info.csv': ('null_info', True),
+    'runtime_counts.csv': ('runtime_counts', False),
+    'language_counts.csv': ('language_counts', False),
+}
+
+# 文件内容的指纹
+def file_fingerprint(filepath, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# 读取缓存的统计量，没有缓存时读取数据计算并写入缓存；返回 (统计量, 是否命中缓存)
+def load_aggregates(filepath, fingerprint, cache_dir):
+    cache_filepath = os.path.join(cache_dir, f"{fingerprint}.pkl")
+    if os.path.exists(cache_filepath):
+        return pd.read_pickle(cache_filepath), True
+
+    aggregates = aggregate_metadata(read_table(filepath, low_memory=False))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_filepath = f"{cache_filepath}.tmp"
+    pd.to_pickle(aggregates, tmp_filepath)
+    os.replace(tmp_filepath, cache_filepath)
+    return aggregates, False
+
+# 用非交互的 Agg 后端绘制一个图表并保存；在子进程中执行
+def render_chart(name, data, output_filepath):
+    matplotlib.use('Agg')
+    plot, _, args = CHARTS[name]
+    plot(data, *args)
+    plt.savefig(output_filepath)
+    plt.close('all')
+    return output_filepath
+
+@instrument()
+def metadata_report(filepath, output_dir="./report", cache_dir=None, workers=None):
+    """
+    无界面地生成 metadata_analyse 的所有图表和表格。
+
+    参数：
+    - filepath: str
+        movies_metadata 文件（csv、parquet 或 arrow）。
+    - output_dir: str, 可选
+        PNG 和 CSV 的输出目录，目录中的 report.json 记录生成时输入文件的指纹。
+    - cache_dir: str, 可选
+        统计量的缓存目录，默认为 output_dir 下的 .cache。
+    - workers: int, 可选
+        并行绘图的进程数，默认为 CPU 数；1 表示在当前进程中绘制。
+
+    输入文件没有变化且输出文件都存在时直接返回，不读取数据也不重新绘图。
+    返回 report.json 的内容。
+    """
+    cache_dir = cache_dir or os.path.join(output_dir, '.cache')
+    manifest_filepath = os.path.join(output_dir, 'report.json')
+    fingerprint = file_fingerprint(filepath)
+
+    if os.path.exists(manifest_filepath):
+        with open(manifest_filepath, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('fingerprint') == fingerprint and \
+                all(os.path.exists(os.path.join(output_dir, name)) for name in manifest.get('files', [])):
+            print(f"{filepath} is unchanged, report in {output_dir} is up to date")
+            return manifest
+
+    aggregates, cached = load_aggregates(filepath, fingerprint, cache_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    for name, (key, index) in TABLES.items():
+        aggregates[key].to_csv(os.path.join(output_dir, name), index=index)
+
+    tasks = [(name, aggregates[key], os.path.join(output_dir, name)) for name, (_, key, _) in CHARTS.items()]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for task in tasks:
+            render_chart(*task)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            list(executor.map(render_chart, *zip(*tasks)))
+
+    manifest = {'input': os.path.abspath(filepath), 'fingerprint': fingerprint, 'cached_aggregates': cached,
+                'files': list(TABLES) + list(CHARTS)}
+    with open(manifest_filepath, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    print(f"Report written to {output_dir} ({'cached' if cached else 'computed'} aggregates)")
+    return manifest
+
+# 分析源数据，支持 csv、parquet、arrow 格式
+@instrument()
 def metadata_analyse(filepath):
-    metadata = pd.read_csv(filepath)
+    metadata = read_table(filepath)
 
     check_values(metadata)
 
@@ -145,32 +265,47 @@ def metadata_analyse(filepath):
 
     time_language_histogram(metadata)
 
-# 分析'genres','production_countries','production_companies','spoken_languages'字段的数据
-def check_data(filepath, columns):
-    # 读取数据集，指定分隔符为 "|"
-    metadata = pd.read_csv(filepath, low_memory=False)
+# 分析'genres','production_countries','production_companies','spoken_languages','director','actor'等用'|'分隔的字段
+@instrument()
+def count_values(metadata, columns):
+    """
+    一次扫描统计多个用'|'分隔的字段中每个值出现的次数，空值不计入。
+
+    返回字典：字段名 -> DataFrame(value, count)，按 count 降序排列。
+    """
+    # 把所有字段叠成一列，索引的第二层是字段名，空值在 stack 时被丢弃
+    values = metadata[columns].astype(object).stack()
+    values = values.astype(str).str.split('|').explode()
+    values = values[values != '']
+
+    counts = pd.DataFrame({'column': values.index.get_level_values(1), 'value': values.to_numpy()}).value_counts()
+    counts = counts.reset_index(name='count')
+
+    tables = {column: table.drop(columns='column').reset_index(drop=True)
+              for column, table in counts.groupby('column', sort=False)}
+    # 没有任何值的字段返回空表
+    return {column: tables.get(column, pd.DataFrame(columns=['value', 'count'])) for column in columns}
 
-    # 遍历每一列
-    for column in columns:
-        # 统计每个独立的值出现的次数
-        data_counts = {}
+@instrument()
+def check_data(filepath, columns, top=10):
+    # 读取数据集，只读取需要统计的列；parquet/arrow 格式可以直接按列读取
+    metadata = read_table(filepath, columns=columns, low_memory=False)
 
-        # 遍历每一行
-        for index, row in metadata.iterrows():
-            # 将当前行的数据转换为字符串类型，然后拆分成单个值，并去重
-            data_list = str(row[column]).split("|")
-            # 统计每个值的出现次数
-            for data in data_list:
-                data_counts[data] = data_counts.get(data, 0) + 1
+    tables = count_values(metadata, columns)
+    set_rows(rows_in=len(metadata), rows_out=sum(len(table) for table in tables.values()))
 
-        # 打印每个值的计数
-        for data, count in data_counts.items():
-            print(f"{data}: {count}")
+    # 打印每个字段出现次数最多的值
+    for column, table in tables.items():
+        print(f"\n{column}:")
+        print(table.head(top).to_string(index=False))
+        print("Total unique values:", len(table))
 
-        print("Total unique values:", len(data_counts))
+    return tables
 
 if __name__ == "__main__":
     # metadata_analyse("../archive/movies_metadata.csv")
-    columns = ['genres','production_countries','spoken_languages']
+    # 在服务器上运行时使用报告模式，图表保存到 ./report，数据没有变化时不会重新计算
+    # metadata_report("../archive/movies_metadata.csv", "./report")
+    columns = ['genres','production_countries','production_companies','spoken_languages','director','actor']
     check_data("./movies.csv",columns)
     
@@ -1,6 +1,43 @@
 import pandas as pd
 import ast
 import numpy as np
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import zip_longest
+
+from instrumentation import count_rows, instrument, peak_rss_mb, record_error, set_rows, stage
+from invertedIndex import build_index
+from jsonParser import extract_values, parse_column, parse_records, join_column
+from normalizedStore import store_from_movies
+from ratingMatrix import build_rating_matrix
+from tableIO import ChunkWriter, read_table, with_format, write_table
+
+# 需要删除的字段
+COLUMNS_TO_DROP = ['belongs_to_collection', 'homepage', 'tagline', 'video', 'adult', 'imdb_id']
+
+# 处理后movies.csv的字段顺序
+NEW_COLUMN_ORDER = ['id', 'title', 'original_title', 'genres','original_language','spoken_languages','overview','runtime','release_date','production_companies','production_countries','status','budget','revenue','popularity','vote_count','vote_average','director','actor','character']
+
+# 评分数据集的列类型，用 int32/float32 代替默认的 int64/float64（timestamp 在 2038 年前都不会超出 int32）
+RATINGS_DTYPES = {'userId': 'int32', 'movieId': 'int32', 'rating': 'float32', 'timestamp': 'int32'}
+
+# 需要提取name并用'|'分隔的json字段
+ATTRIBUTE_COLUMNS = ['production_countries', 'production_companies', 'spoken_languages']
+
+# movies_metadata 中数值和分类字段的类型；整数列使用可空整数，其余字段保持字符串
+# id 和 budget 在原始数据中是整数，revenue、runtime、vote_count 以 '95478326.0' 的形式保存，按浮点数读取
+METADATA_DTYPES = {
+    'id': 'Int32',
+    'budget': 'Int64',
+    'revenue': 'float64',
+    'runtime': 'float64',
+    'popularity': 'float64',
+    'vote_count': 'float64',
+    'vote_average': 'float64',
+    'original_language': 'category',
+    'status': 'category',
+}
 
 # 提取样本
 def extract_sample(filepath,output_filepath):
@@ -36,101 +73,242 @@ def clean_metadata(filepath, columns_to_drop, output_filepath='movies_metadata.c
 def split_data(data, columns):
     for column in columns:
         try:
-            # 将字段的字符串转换为列表
-            data[column] = data[column].apply(lambda x: [] if pd.isna(x) else [entry['name'] for entry in eval(str(x))])
-            # 将列表中的字符串连接起来，用'|'分隔
-            data[column] = data[column].apply(lambda x: '|'.join(x))
+            # 批量解析字段的字符串，提取name并用'|'连接
+            data[column] = join_column(data[column], key='name')
         except Exception as e:
             print(f"Error occurred while processing column '{column}': {e}")
+            record_error(e)
+
+# 按 METADATA_DTYPES 转换字段类型，并在解析 json 字段之前去重
+def coerce_metadata(metadata):
+    """
+    参数：
+    - metadata: DataFrame
+        按字符串读取的 metadata（或与 credits 按行拼接后的数据）。
+
+    返回 (metadata, quarantined)：
+    - metadata: 转换类型、按 id 去重（保留第一行）后的数据。
+    - quarantined: id 不是非负整数或数值字段无法转换的行，保留原始文本，reason 列为出错的字段。
+    """
+    numeric = {column: dtype for column, dtype in METADATA_DTYPES.items()
+               if column in metadata.columns and dtype != 'category'}
+    coerced = {column: pd.to_numeric(metadata[column], errors='coerce') for column in numeric}
+
+    # 原本有值但无法转换为数字的字段，以及不是非负整数的 id
+    failed = pd.DataFrame({column: values.isna() & metadata[column].notna() for column, values in coerced.items()})
+    ids = coerced['id']
+    failed['id'] = ids.isna() | (ids < 0) | (ids % 1 != 0)
+    for column, dtype in numeric.items():
+        if dtype.startswith('Int') and column != 'id':
+            failed[column] |= coerced[column].notna() & (coerced[column] % 1 != 0)
+    bad = failed.any(axis=1).to_numpy()
+
+    quarantined = metadata[bad].copy()
+    quarantined['reason'] = failed[bad].apply(lambda row: '|'.join(row.index[row]), axis=1) if bad.any() else ''
+
+    # 合法行中重复的 id 只保留第一行
+    keep = ~bad & ~ids.where(~bad).duplicated().to_numpy()
+    metadata = metadata[keep].copy()
+    for column, dtype in numeric.items():
+        metadata[column] = coerced[column][keep].astype(dtype)
+    for column, dtype in METADATA_DTYPES.items():
+        if dtype == 'category' and column in metadata.columns:
+            metadata[column] = metadata[column].astype('category')
+    return metadata, quarantined
+
+# 把已处理过的 movies 数据（例如读回的输出文件）转换为与 coerce_metadata 相同的类型
+def apply_metadata_dtypes(movies):
+    movies = movies.copy()
+    for column, dtype in METADATA_DTYPES.items():
+        if column not in movies.columns:
+            continue
+        if dtype == 'category':
+            movies[column] = movies[column].astype('category')
+        else:
+            movies[column] = pd.to_numeric(movies[column]).astype(dtype)
+    return movies
+
+def print_load_summary(rows, kept, quarantined):
+    print(f"metadata: kept {kept} rows, quarantined {quarantined} rows, "
+          f"dropped {rows - kept - quarantined} duplicate ids")
+
+# 按字符串读取 metadata（可以是 concat_datasets 合并后的文件），转换类型、去重，异常行写入 quarantine_filepath
+def read_metadata(filepath, quarantine_filepath=None):
+    raw = read_table(filepath, dtype=str)
+    metadata, quarantined = coerce_metadata(raw)
+    print_load_summary(len(raw), len(metadata), len(quarantined))
+    if quarantine_filepath:
+        write_table(quarantined, quarantine_filepath)
+    return metadata
 
 # 提取poster_path列并写入另一个文件
 def extract_and_remove_column(metadata, column_name, output_filepath):
     # 提取poster_path和对应的id，写入另一个文件
     poster_data = metadata[['id', column_name]]
-    poster_data.to_csv(output_filepath, index=False)
+    write_table(poster_data, output_filepath)
 
     # 删除poster_path列
     metadata.drop(columns=[column_name], inplace=True)
 
 # 提取属性
+@instrument()
 def extract_attributes(filepath, columns):
     try:
-        # 读取 CSV 文件到 DataFrame
-        df = pd.read_csv(filepath, na_values=[pd.NA, np.nan])
+        # 读取 CSV（或 parquet/arrow）文件到 DataFrame
+        df = read_table(filepath, na_values=[pd.NA, np.nan])
+        set_rows(rows_in=len(df), rows_out=len(df))
         
-        # 提取每行的属性
+        # 提取每行的属性，只保留后续需要的name字段
         attributes = {}
         for column in columns:
-            attributes[column] = df[column].apply(lambda x: eval(x) if isinstance(x, str) else x)
+            attributes[column] = parse_column(df[column], fields=['name'])
 
         return df, attributes
     
     except Exception as e:
         print(f"Error occurred while processing file '{filepath}': {e}")
+        record_error(e)
         return None, None
 
-def data_processing(filepath, output_filepath):
-    try:
-        metadata = pd.read_csv(filepath, low_memory=False)
-        metadata = clean_metadata(filepath, ['belongs_to_collection', 'homepage', 'tagline', 'video', 'adult', 'imdb_id'])
+# 对合并后的数据做删除字段、提取poster_path、处理crew/cast、分割json字段的处理，不做去重
+# 返回处理后的数据和提取出的 id、poster_path 两列
+def process_metadata(metadata, columns_to_process=('genres',)):
+    # 删除不需要的列
+    metadata = metadata.drop(columns=COLUMNS_TO_DROP, errors='ignore')
 
-        # 提取poster_path和对应的id，写入另一个文件，并删除poster_path列
-        extract_and_remove_column(metadata, 'poster_path', "./poster_path.csv")
+    # 提取poster_path和对应的id，并删除poster_path列
+    posters = metadata[['id', 'poster_path']]
+    metadata = metadata.drop(columns=['poster_path'])
 
-        # 处理crew，cast字段内容
-        metadata = handle_credits(metadata)
+    # 处理crew，cast字段内容
+    metadata = handle_credits(metadata)
 
-        new_column_order = ['id', 'title', 'original_title', 'genres','original_language','spoken_languages','overview','runtime','release_date','production_companies','production_countries','status','budget','revenue','popularity','vote_count','vote_average','director','actor','character']
+    # 使用 reindex 方法重新排列列顺序
+    metadata = metadata.reset_index(drop=True)  # 重置索引，确保连续
+    metadata = metadata.reindex(columns=NEW_COLUMN_ORDER)
 
-        # 使用 reindex 方法重新排列列顺序
-        metadata = metadata.reset_index(drop=True)  # 重置索引，确保连续
-        metadata = metadata.reindex(columns=new_column_order)
+    # 提取json数据中需要的字符并用|分割
+    split_data(metadata, list(columns_to_process))
+    return metadata, posters
+
+@instrument()
+def data_processing(filepath, output_filepath, poster_filepath="./poster_path.csv",
+                    quarantine_filepath="./metadata_quarantine.csv"):
+    try:
+        # 读取时就转换类型并去重，异常行写入 quarantine_filepath，重复行不再解析 json 字段
+        metadata = read_metadata(filepath, quarantine_filepath)
+        set_rows(rows_in=len(metadata))
+
+        metadata, posters = process_metadata(metadata)
+
+        # 将poster_path和对应的id写入另一个文件
+        write_table(posters, poster_filepath)
 
         # 根据 "id" 列的值进行升序排序
         # metadata.sort_values(by='id', ascending=True, inplace=True)
 
-        # 需要处理的字段
-        # 提取json数据中需要的字符并用|分割
-        columns_to_process = ['genres']
-        
-        split_data(metadata, columns_to_process)
-        # 发现有重复id数据，进行去重
-        metadata.drop_duplicates(subset=['id'], inplace=True)
-        
-        metadata.to_csv(output_filepath, index=False)
+        write_table(metadata, output_filepath)
+        set_rows(rows_out=len(metadata))
 
     except Exception as e:
         print("An error occurred during data processing:", e)
+        record_error(e)
+
+# 分块处理：按行对齐地分块读取movies_metadata.csv和credits.csv，逐块合并、处理、去重并追加写入
+@instrument()
+def data_processing_chunked(metadata_filepath, credits_filepath, output_filepath, poster_filepath="./poster_path.csv", chunksize=5000,
+                            quarantine_filepath="./metadata_quarantine.csv"):
+    """
+    流式地完成 concat_datasets、data_processing 和 extract_attributes 的工作，
+    内存占用只取决于 chunksize，不随数据集大小增长。
+
+    参数：
+    - metadata_filepath: str
+        movies_metadata.csv 的文件路径。
+    - credits_filepath: str
+        credits.csv 的文件路径，与 metadata 按行号对齐（与 concat_datasets 一致）。
+    - output_filepath: str
+        处理后的 movies.csv 的文件路径，扩展名为 .parquet/.arrow 时输出列式格式。
+    - poster_filepath: str, 可选
+        poster_path 输出文件的路径。
+    - chunksize: int, 可选
+        每次读取的行数。
+    - quarantine_filepath: str, 可选
+        id 或数值字段不合法的行写入该文件。
+    """
+    try:
+        # 全部按字符串读取，避免每块推断出的类型不一致，再由 coerce_metadata 统一转换
+        metadata_chunks = pd.read_csv(metadata_filepath, dtype=str, chunksize=chunksize)
+        credits_chunks = pd.read_csv(credits_filepath, usecols=['crew', 'cast'], dtype=str, chunksize=chunksize)
+
+        # 已经写出的id，用于跨块去重
+        seen_ids = set()
+        rows_in = quarantined_rows = 0
+        with ChunkWriter(output_filepath, columns=NEW_COLUMN_ORDER) as movies_writer, \
+                ChunkWriter(poster_filepath, columns=['id', 'poster_path']) as poster_writer, \
+                ChunkWriter(quarantine_filepath) as quarantine_writer:
+            for metadata, credits in zip_longest(metadata_chunks, credits_chunks):
+                # 两个文件行数不同时，缺少的部分用空值补齐
+                if metadata is None:
+                    metadata = pd.DataFrame(index=credits.index, columns=['id', 'poster_path'])
+                if credits is None:
+                    credits = pd.DataFrame(index=metadata.index, columns=['crew', 'cast'])
+
+                merged = pd.concat([metadata, credits[['crew', 'cast']]], axis=1)
+                rows_in += len(merged)
+
+                # 先转换类型、去掉块内重复的id和之前块中已经出现过的id，再解析 json 字段
+                merged, quarantined = coerce_metadata(merged)
+                if len(quarantined):
+                    quarantine_writer.write(quarantined)
+                    quarantined_rows += len(quarantined)
+                merged = merged[~merged['id'].isin(seen_ids)]
+                seen_ids.update(merged['id'])
+
+                merged, posters = process_metadata(merged, ['genres'] + ATTRIBUTE_COLUMNS)
+                poster_writer.write(posters)
+                movies_writer.write(merged)
+        print_load_summary(rows_in, len(seen_ids), quarantined_rows)
+        set_rows(rows_in=rows_in, rows_out=len(seen_ids))
+
+    except Exception as e:
+        print("An error occurred during chunked data processing:", e)
+        record_error(e)
+
+# 把若干等长的列按行切分成多个分区，用进程池并行执行 func(*分区中的各列)，再按原顺序拼接结果
+# func 必须是模块级函数，返回与输入列同样个数或固定个数的列表；workers <= 1 时直接在当前进程执行
+def run_partitions(func, columns, workers=1):
+    columns = [list(column) for column in columns]
+    rows = len(columns[0]) if columns else 0
+    if workers <= 1 or rows < 2:
+        return func(*columns)
+
+    # 分区数取进程数的4倍，避免某个分区特别慢时其他进程空闲
+    bounds = np.linspace(0, rows, min(rows, workers * 4) + 1, dtype=np.int64)
+    partitions = [[column[start:end] for column in columns] for start, end in zip(bounds[:-1], bounds[1:])]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(func, *zip(*partitions)))
+
+    # executor.map 按提交顺序返回，逐个输出列拼接即可保持原顺序
+    return tuple([value for result in results for value in result[i]] for i in range(len(results[0])))
+
+# 从 crew、cast 中提取导演、演员和角色，返回三个字符串列表
+def extract_credits(crew, cast):
+    # 处理 crew 列中的导演信息，如果没有导演或 crew 为空值，则为空字符串
+    director_list = [extract_values(cell, key='name', where=('job', 'Director')) for cell in crew]
+
+    # 处理 cast 列中的演员和角色信息，仅获取前15个演员
+    actor_list = [extract_values(cell, key='name', limit=15) for cell in cast]
+    character_list = [extract_values(cell, key='character', limit=15) for cell in cast]
+    return director_list, actor_list, character_list
 
 # 处理credits.csv文件
-# 把crew，cast字段分割成director，actor，character字段
-def handle_credits(input_df: pd.DataFrame) -> pd.DataFrame:
+# 把crew，cast字段分割成director，actor，character字段；workers > 1 时用多进程并行处理
+@instrument()
+def handle_credits(input_df: pd.DataFrame, workers=1) -> pd.DataFrame:
     try:
-        # 初始化导演、演员和角色列表
-        director_list = []
-        actor_list = []
-        character_list = []
-
-        # 处理 crew 列中的导演信息
-        for crew_data in input_df['crew']:
-            if pd.notnull(crew_data):  # 检查 crew_data 是否为空值
-                crew_data = eval(crew_data)  # 将字符串转换为列表
-                directors = [member['name'] for member in crew_data if member.get('job') == 'Director']  # 使用 member.get() 方法以避免 KeyError
-                director_list.append('|'.join(directors) if directors else '')  # 如果没有导演，将其设为空字符串
-            else:
-                director_list.append('')  # 如果 crew_data 为空值，将 director_list 中添加一个空字符串
-
-        # 处理 cast 列中的演员和角色信息，仅获取前15个演员
-        for cast_data in input_df['cast']:
-            if pd.notnull(cast_data):  # 检查 cast_data 是否为空值
-                cast_data = eval(cast_data)  # 将字符串转换为列表
-                actors = [member['name'] for member in cast_data[:15]]
-                characters = [member['character'] for member in cast_data[:15]]
-                actor_list.append('|'.join(actors))
-                character_list.append('|'.join(characters))
-            else:
-                actor_list.append('')  # 如果 cast_data 为空值，将 actor_list 和 character_list 中添加一个空字符串
-                character_list.append('')
+        director_list, actor_list, character_list = run_partitions(
+            extract_credits, [input_df['crew'], input_df['cast']], workers)
 
         # 添加导演、演员和角色信息到原始 DataFrame
         input_df['director'] = director_list
@@ -144,6 +322,7 @@ def handle_credits(input_df: pd.DataFrame) -> pd.DataFrame:
 
     except Exception as e:
         print("An error occurred during handling credits:", str(e))
+        record_error(e)
 
 # def handle_credits(filepath, output_filepath):
 #     try:
@@ -179,24 +358,44 @@ def handle_credits(input_df: pd.DataFrame) -> pd.DataFrame:
 #     except Exception as e:
 #         print("An error occurred while handling credits.csv:", e)
 
-# 处理keywords.csv数据集
-def handle_keywords(filepath,output_filepath):
+# 提取每部电影的关键词，返回电影id、关键词id、关键词三个列表
+def extract_keywords(movie_ids, cells):
+    movie_id_list = []
+    keyword_id_list = []
+    tag_list = []
+    for movie_id, cell in zip(movie_ids, cells):
+        for keyword in parse_records(cell, fields=('id', 'name')):
+            movie_id_list.append(movie_id)
+            keyword_id_list.append(keyword['id'])
+            tag_list.append(keyword['name'])
+    return movie_id_list, keyword_id_list, tag_list
+
+# 处理keywords.csv数据集；workers > 1 时用多进程并行处理
+@instrument()
+def handle_keywords(filepath,output_filepath,workers=1):
     keywords = pd.read_csv(filepath)
+    set_rows(rows_in=len(keywords))
 
     # 提取keywords字段下的id和name，写入到新的DataFrame
-    keyword_data = []
-    for idx, row in keywords.iterrows():
-        movie_id = row['id']
-        for keyword in eval(row['keywords']):
-            keyword_data.append({'movieId': movie_id, 'userId': keyword['id'], 'tag': keyword['name']})
+    movie_ids, keyword_ids, tags = run_partitions(extract_keywords, [keywords['id'], keywords['keywords']], workers)
 
     # 创建包含userId、tag和movieId的DataFrame
-    keyword_df = pd.DataFrame(keyword_data)
+    keyword_df = pd.DataFrame({'movieId': movie_ids, 'userId': keyword_ids, 'tag': tags})
+
+    # 保存结果到新的CSV（或 parquet/arrow）文件
+    write_table(keyword_df, output_filepath, encoding='utf-8')
+    set_rows(rows_out=len(keyword_df))
+
+# 将credits中的crew、cast列按行号拼接到metadata上
+def concat_frames(metadata, credits):
+    # 选择 credits 数据集中的 director、actor 和 character 列
+    credits_selected = credits[['crew','cast']]
 
-    # 保存结果到新的CSV文件
-    keyword_df.to_csv(output_filepath, encoding='utf-8', index=False)
+    # 使用 concat 函数将 metadata 数据集和 credits 中选定的列堆叠在一起
+    return pd.concat([metadata, credits_selected], axis=1)
 
 # 将演员、导演数据合并到电影数据集里
+@instrument()
 def concat_datasets(metadata_filepath, credits_filepath):
     try:
         # 读取 metadata 和 credits 数据集
@@ -204,19 +403,18 @@ def concat_datasets(metadata_filepath, credits_filepath):
         # handle_credits(credits_filepath, "./credits.csv")
         credits = pd.read_csv("./credits.csv")
 
-        # 选择 credits 数据集中的 director、actor 和 character 列
-        credits_selected = credits[['crew','cast']]
-
-        # 使用 concat 函数将 metadata 数据集和 credits 中选定的列堆叠在一起
-        merged_data = pd.concat([metadata, credits_selected], axis=1)
+        merged_data = concat_frames(metadata, credits)
 
         # 保存合并后的数据集到文件
         merged_data.to_csv("./movies.csv",index=False)
+        set_rows(rows_in=len(metadata), rows_out=len(merged_data))
 
     except Exception as e:
         print("An error occurred while concatenating datasets:", e)
+        record_error(e)
 
 # 将提取到的数据用'|'分隔并写入原csv文件
+@instrument()
 def write_names_to_file(df, attributes):
     try:
         # 将提取的属性值写入原始 DataFrame 中相应的字段
@@ -230,44 +428,324 @@ def write_names_to_file(df, attributes):
 
     except Exception as e:
         print(f"Error occurred while writing to file: {e}")
+        record_error(e)
 
-def clean_id(moviesFilepath,notCleanedFilepath,outputfilepath,column):
-    movies = pd.read_csv(moviesFilepath)
-    ratings = pd.read_csv(notCleanedFilepath)
-
+# 获取movies中所有合法的id
+def valid_ids(movies):
     # 将 'id' 列转换为整数，将无法转换的值设置为 NaN
-    movies['id'] = pd.to_numeric(movies['id'], errors='coerce')
+    ids = pd.to_numeric(movies['id'], errors='coerce')
 
     # 删除包含 NaN 值的行
-    movies = movies.dropna(subset=['id'])
-    id_values = set(movies['id'])
+    return set(ids.dropna())
+
+def align_ratings(id_values, notCleanedFilepath, outputfilepath, column):
+    ratings = pd.read_csv(notCleanedFilepath)
 
     ratings = ratings[ratings[column].isin(id_values)]
 
-    ratings.to_csv(outputfilepath,index=False)
+    write_table(ratings, outputfilepath)
 
-def id_align():
-    clean_id("./movies.csv","ratings_small.csv","ratings_small.csv","movieId")
-    clean_id("./movies.csv","ratings.csv","ratings.csv","movieId")
+# 分块对齐评分数据集：按 chunksize 行流式读取，用 id 查找表过滤，先写入临时文件再替换为输出文件
+@instrument()
+def align_ratings_chunked(id_values, notCleanedFilepath, outputfilepath, column='movieId', chunksize=1000000):
+    """
+    返回统计信息：保留行数 kept、删除行数 dropped、耗时 seconds、本次调用期间进程内存峰值的增加量 peak_growth_mb。
+    peak_growth_mb 不包含调用之前已经达到的峰值（例如之前对齐的文件或 run_pipeline 中的 movies 数据），
+    调用期间的内存一直低于之前的峰值时为0。
+    输出文件可以与输入文件相同，处理完成之前不会覆盖原文件。
+    """
+    start = time.perf_counter()
+    peak_before = peak_rss_mb()
+
+    # 用布尔数组作为查找表，下标即id，避免对每一块做哈希查找
+    ids = np.array(sorted(int(value) for value in id_values if value >= 0), dtype=np.int64)
+    lookup = np.zeros(ids[-1] + 2 if len(ids) else 1, dtype=bool)
+    lookup[ids] = True
+
+    kept = dropped = 0
+    # 临时文件保留原扩展名，以便按同样的格式写出
+    root, ext = os.path.splitext(outputfilepath)
+    tmp_filepath = f"{root}.tmp{ext}"
+    try:
+        with ChunkWriter(tmp_filepath, columns=list(RATINGS_DTYPES)) as writer:
+            for ratings in pd.read_csv(notCleanedFilepath, dtype=RATINGS_DTYPES, chunksize=chunksize):
+                values = ratings[column].to_numpy()
+                # 超出查找表范围的id都映射到最后一个位置（值为False）
+                mask = lookup[np.clip(values, 0, len(lookup) - 1)] & (values >= 0)
+                ratings = ratings[mask]
+                writer.write(ratings)
+                kept += len(ratings)
+                dropped += len(mask) - len(ratings)
+        os.replace(tmp_filepath, outputfilepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+    stats = {'kept': kept, 'dropped': dropped, 'seconds': time.perf_counter() - start,
+             'peak_growth_mb': peak_rss_mb() - peak_before}
+    set_rows(rows_in=kept + dropped, rows_out=kept)
+    print(f"{notCleanedFilepath} -> {outputfilepath}: kept {kept} rows, dropped {dropped} rows, "
+          f"{stats['seconds']:.2f}s, peak memory +{stats['peak_growth_mb']:.1f} MB")
+    return stats
+
+@instrument()
+def clean_id(moviesFilepath,notCleanedFilepath,outputfilepath,column):
+    movies = read_table(moviesFilepath, columns=['id'])
+    align_ratings(valid_ids(movies), notCleanedFilepath, outputfilepath, column)
+
+# 对齐评分数据集，结果写入新的文件，返回每个文件的统计信息
+# output_format 为 'parquet' 或 'arrow' 时输出列式格式
+@instrument()
+def id_align(moviesFilepath="./movies.csv", chunksize=1000000, output_format=None):
+    movies = read_table(moviesFilepath, columns=['id'])
+    id_values = valid_ids(movies)
+    return {
+        "ratings_small.csv": align_ratings_chunked(id_values, "ratings_small.csv", with_format("ratings_small_aligned.csv", output_format), "movieId", chunksize),
+        "ratings.csv": align_ratings_chunked(id_values, "ratings.csv", with_format("ratings_aligned.csv", output_format), "movieId", chunksize),
+    }
+
+# 一次性完成整个处理流程：所有阶段都在同一个 DataFrame 上进行，只在最后写出结果
+def run_pipeline(metadata_filepath, credits_filepath, output_filepath="./movies.csv", poster_filepath="./poster_path.csv",
+                 ratings_files=(("./ratings_small.csv", "./ratings_small_aligned.csv"), ("./ratings.csv", "./ratings_aligned.csv")),
+                 output_format=None, index_dir=None, keywords_filepath=None, workers=1,
+                 quarantine_filepath="./metadata_quarantine.csv", matrix_dir=None, store_filepath=None):
+    """
+    等价于 concat_datasets、data_processing、extract_attributes、write_names_to_file、id_align 依次执行，
+    但中间结果不再写入 movies.csv 再读回。
+
+    参数：
+    - metadata_filepath: str
+        movies_metadata.csv 的文件路径。
+    - credits_filepath: str
+        credits.csv 的文件路径。
+    - output_filepath: str, 可选
+        处理后的 movies.csv 的文件路径。
+    - poster_filepath: str, 可选
+        poster_path 输出文件的路径。
+    - ratings_files: 可迭代的 (输入路径, 输出路径), 可选
+        需要与 movies 的 id 对齐的评分数据集。
+    - output_format: str, 可选
+        'csv'、'parquet' 或 'arrow'，替换所有输出文件的扩展名；默认按各输出路径的扩展名决定。
+    - index_dir: str, 可选
+        指定时在该目录下生成 genres、director、actor、production_companies 的倒排索引。
+    - keywords_filepath: str, 可选
+        handle_keywords 输出的关键词文件，与 index_dir 一起指定时倒排索引中包含 keywords 字段。
+    - workers: int, 可选
+        处理 crew/cast 字段时使用的进程数。
+    - quarantine_filepath: str, 可选
+        id 或数值字段不合法的行写入该文件。
+    - matrix_dir: str, 可选
+        指定时用 ratings_files 中最后一个对齐后的评分数据构建用户-电影稀疏评分矩阵，写入该目录。
+    - store_filepath: str, 可选
+        指定时把演员、导演（以及 keywords_filepath 中的关键词）保存为 normalizedStore 的规范化存储（.npz）。
+
+    返回每个阶段的耗时（秒），按执行顺序排列。
+    """
+    timings = {}
+    output_filepath = with_format(output_filepath, output_format)
+    poster_filepath = with_format(poster_filepath, output_format)
+    ratings_files = [(input_filepath, with_format(ratings_output_filepath, output_format))
+                     for input_filepath, ratings_output_filepath in ratings_files]
+
+    # 执行一个阶段并记录耗时；开启 instrumentation 时同时记录为 run_pipeline.<阶段名>
+    def run_stage(name, func, *args):
+        with stage(f"run_pipeline.{name}", count_rows(args[0]) if args else None) as record:
+            start = time.perf_counter()
+            result = func(*args)
+            timings[name] = time.perf_counter() - start
+            record.rows_out = count_rows(result)
+        return result
+
+    def load(merged):
+        metadata, quarantined = coerce_metadata(merged)
+        print_load_summary(len(merged), len(metadata), len(quarantined))
+        if quarantine_filepath:
+            write_table(quarantined, with_format(quarantine_filepath, output_format))
+        return metadata
+
+    def clean(metadata):
+        metadata = metadata.drop(columns=COLUMNS_TO_DROP, errors='ignore')
+        posters = metadata[['id', 'poster_path']]
+        return metadata.drop(columns=['poster_path']), posters
+
+    def split(metadata):
+        metadata = metadata.reset_index(drop=True).reindex(columns=NEW_COLUMN_ORDER)
+        split_data(metadata, ['genres'])
+        return metadata
+
+    def attributes(metadata):
+        split_data(metadata, ATTRIBUTE_COLUMNS)
+        return metadata
+
+    def align(metadata):
+        id_values = valid_ids(metadata)
+        for input_filepath, ratings_output_filepath in ratings_files:
+            align_ratings_chunked(id_values, input_filepath, ratings_output_filepath, "movieId")
+
+    def write(metadata, posters):
+        write_table(posters, poster_filepath)
+        write_table(metadata, output_filepath)
+
+    def store(metadata, keywords):
+        normalized = store_from_movies(metadata, keywords)
+        normalized.save(store_filepath)
+        return normalized
+
+    try:
+        metadata = run_stage('read', lambda: (pd.read_csv(metadata_filepath, dtype=str),
+                                              pd.read_csv(credits_filepath, usecols=['crew', 'cast'], dtype=str)))
+        metadata = run_stage('concat', concat_frames, *metadata)
+        # 在解析 json 字段之前转换类型、去重，隔离异常行
+        metadata = run_stage('load', load, metadata)
+        keywords = read_table(keywords_filepath) if keywords_filepath and (index_dir or store_filepath) else None
+        if store_filepath:
+            # 在 crew/cast 被解析成'|'分隔的字符串之前，从原始 json 构建规范化存储
+            run_stage('store', store, metadata, keywords)
+        metadata, posters = run_stage('clean', clean, metadata)
+        metadata = run_stage('credits', handle_credits, metadata, workers)
+        metadata = run_stage('split', split, metadata)
+        metadata = run_stage('attributes', attributes, metadata)
+        run_stage('write', write, metadata, posters)
+        if index_dir:
+            run_stage('index', build_index, metadata, index_dir, keywords)
+        run_stage('id align', align, metadata)
+        if matrix_dir and ratings_files:
+            run_stage('matrix', build_rating_matrix, ratings_files[-1][1], matrix_dir)
+    except Exception as e:
+        print("An error occurred while running the pipeline:", e)
+        record_error(e)
+
+    # 打印每个阶段的耗时
+    for name, seconds in timings.items():
+        print(f"{name:<12}{seconds:>10.3f}s")
+    print(f"{'total':<12}{sum(timings.values()):>10.3f}s")
+    return timings
+
+# 计算每一行内容的指纹（64位哈希），返回以 id 为索引的 Series；重复的 id 只保留第一行
+def fingerprint_rows(merged):
+    hashes = pd.util.hash_pandas_object(merged, index=False)
+    hashes.index = merged['id'].astype(str)
+    return hashes[~hashes.index.duplicated()]
+
+# 读取上次运行保存的指纹，没有时返回 None
+def read_fingerprints(filepath):
+    if not os.path.exists(filepath):
+        return None
+    fingerprints = pd.read_csv(filepath, dtype={'id': str, 'hash': 'uint64'}, keep_default_na=False)
+    return pd.Series(fingerprints['hash'].to_numpy(), index=fingerprints['id'])
+
+# 用新处理的行替换输出文件中对应 id 的行，删除已移除的 id，并按输入中 id 的顺序排列
+def merge_rows(existing, updated, drop_ids, order):
+    existing = existing[~existing['id'].astype(str).isin(drop_ids)]
+    merged = pd.concat([existing, updated], ignore_index=True)
+    merged = merged.drop_duplicates(subset=['id'])
+    position = pd.Series(np.arange(len(order)), index=order)
+    return merged.iloc[np.argsort(position.reindex(merged['id'].astype(str)).to_numpy(), kind='stable')]
+
+# 增量处理：按 id 对比输入的每一行与上次运行时的指纹，只重新处理新增和变化的电影，并合并到已有的输出中
+@instrument()
+def run_incremental(metadata_filepath, credits_filepath, output_filepath="./movies.csv", poster_filepath="./poster_path.csv",
+                    ratings_files=(("./ratings_small.csv", "./ratings_small_aligned.csv"), ("./ratings.csv", "./ratings_aligned.csv")),
+                    fingerprint_filepath=None, index_dir=None, keywords_filepath=None,
+                    quarantine_filepath="./metadata_quarantine.csv"):
+    """
+    第一次运行（或指纹文件、输出文件不存在）时处理全部数据；之后只处理新增和内容变化的 id，
+    删除输入中已不存在的 id。id 集合变化时重新对齐评分数据集。
+    与 run_pipeline 一样先用 coerce_metadata 转换类型、去重，异常行每次运行都重新写入 quarantine_filepath，
+    不参与指纹比较，输出与 run_pipeline 相同。
+
+    参数与 run_pipeline 相同，另外：
+    - fingerprint_filepath: str, 可选
+        保存每个 id 指纹的文件，默认为输出文件旁边的 <输出文件名>.fingerprints.csv。
+
+    返回新增 added、变化 changed、删除 removed 的 id 数量。
+    """
+    fingerprint_filepath = fingerprint_filepath or f"{os.path.splitext(output_filepath)[0]}.fingerprints.csv"
+    summary = {'added': 0, 'changed': 0, 'removed': 0}
+    try:
+        # 全部按字符串读取，保证指纹只取决于文件内容
+        metadata = pd.read_csv(metadata_filepath, dtype=str)
+        credits = pd.read_csv(credits_filepath, usecols=['crew', 'cast'], dtype=str)
+        merged = concat_frames(metadata, credits)
+
+        # 转换类型、去重，隔离异常行；指纹只对合法的行计算，仍然使用原始的字符串内容
+        valid, quarantined = coerce_metadata(merged)
+        print_load_summary(len(merged), len(valid), len(quarantined))
+        if quarantine_filepath:
+            write_table(quarantined, quarantine_filepath)
+        fingerprints = fingerprint_rows(merged.loc[valid.index])
+        fingerprints.index = valid['id'].astype(str).to_numpy()
+
+        previous = read_fingerprints(fingerprint_filepath)
+        if previous is None or not os.path.exists(output_filepath) or not os.path.exists(poster_filepath):
+            previous = pd.Series(dtype='uint64')
+            existing_movies = pd.DataFrame(columns=NEW_COLUMN_ORDER)
+            existing_posters = pd.DataFrame(columns=['id', 'poster_path'])
+        else:
+            existing_movies = read_table(output_filepath, dtype=str)
+            existing_posters = read_table(poster_filepath, dtype=str)
+
+        common = fingerprints.index.intersection(previous.index)
+        added = fingerprints.index.difference(previous.index)
+        removed = previous.index.difference(fingerprints.index)
+        changed = common[fingerprints[common].to_numpy() != previous[common].to_numpy()]
+        summary = {'added': len(added), 'changed': len(changed), 'removed': len(removed)}
+        print(f"added {len(added)}, changed {len(changed)}, removed {len(removed)} movies")
+
+        if len(added) or len(changed) or len(removed):
+            # 只处理新增和变化的行，valid 中重复的 id 已经只保留第一行
+            todo = valid[valid['id'].astype(str).isin(added.union(changed))]
+            movies, posters = process_metadata(todo, ['genres'] + ATTRIBUTE_COLUMNS)
+
+            drop_ids = changed.union(removed)
+            # 拼接后分类列和可空整数列的类型可能改变，重新转换
+            movies = apply_metadata_dtypes(merge_rows(existing_movies, movies, drop_ids, fingerprints.index))
+            posters = apply_metadata_dtypes(merge_rows(existing_posters, posters, drop_ids, fingerprints.index))
+            write_table(posters, poster_filepath)
+            write_table(movies, output_filepath)
+
+            if index_dir:
+                keywords = read_table(keywords_filepath) if keywords_filepath else None
+                build_index(movies, index_dir, keywords)
+
+            # 只有 id 集合变化时才需要重新对齐评分数据集
+            if len(added) or len(removed):
+                id_values = valid_ids(movies)
+                for input_filepath, ratings_output_filepath in ratings_files:
+                    align_ratings_chunked(id_values, input_filepath, ratings_output_filepath, "movieId")
+
+        # 最后保存指纹，处理中途失败时下次运行会重新处理这些 id
+        write_table(pd.DataFrame({'id': fingerprints.index, 'hash': fingerprints.to_numpy()}), fingerprint_filepath)
+
+    except Exception as e:
+        print("An error occurred during incremental processing:", e)
+        record_error(e)
+    return summary
 
 if __name__ == "__main__":
     # 提取样本试验函数功能
     # extract_sample("../archive/movies_metadata.csv","./metadatatest.csv")
 
-    # 将movies数据集与credits数据集合并
-    concat_datasets("./movies_metadata.csv","./credits.csv")
-
-    # 处理数据，删除多余字段，对一些字段值进行分割；并将处理后的数据写入原文件
-    data_processing("./movies.csv","./movies.csv")
+    # 数据集较大时，可以用分块模式代替 run_pipeline 中的合并、处理、分割步骤
+    # data_processing_chunked("./movies_metadata.csv", "./credits.csv", "./movies.csv", chunksize=5000)
 
     # # 提取keywords，生成keywords数据集
     # handle_keywords("../archive/keywords.csv","./keywords.csv")
 
-    # 将这三个字段的值进行分割处理，'production_countries', 'production_companies', 'spoken_languages'
-    df, attributes = extract_attributes("./movies.csv", ['production_countries', 'production_companies', 'spoken_languages'])
-    
-    if df is not None and attributes is not None:
-        write_names_to_file(df, attributes)
-
-    # 对齐其他数据集与movies_metadata.csv的id列
-    id_align()
\ No newline at end of file
+    # 合并movies与credits数据集，删除多余字段，对json字段的值进行分割，
+    # 并对齐其他数据集与movies_metadata.csv的id列；中间结果不落盘，并打印每个阶段的耗时
+    # 同时生成倒排索引，用于按类型、导演、演员、关键词、制片公司查询电影
+    # 同时把演员、导演和关键词保存为整数编码的规范化存储
+    run_pipeline("./movies_metadata.csv", "./credits.csv", index_dir="./movie_index", keywords_filepath="./keywords.csv",
+                 matrix_dir="./rating_matrix", store_filepath="./credits_store.npz")
+
+    # 每晚更新时可以改用增量模式，只处理新增、变化和删除的电影
+    # run_incremental("./movies_metadata.csv", "./credits.csv", index_dir="./movie_index", keywords_filepath="./keywords.csv")
+
+    # 分步执行的旧流程，每一步都会读写movies.csv
+    # concat_datasets("./movies_metadata.csv","./credits.csv")
+    # data_processing("./movies.csv","./movies.csv")
+    # df, attributes = extract_attributes("./movies.csv", ATTRIBUTE_COLUMNS)
+    # if df is not None and attributes is not None:
+    #     write_names_to_file(df, attributes)
+    # id_align()
\ No newline at end of file
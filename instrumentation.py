@@ -0,0 +1,346 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，无法统计内存峰值
+    resource = None
+
+# 运行指标：每个阶段的耗时、CPU时间、内存峰值的增加量、输入输出行数和错误数，以及计数器和耗时分布（直方图）
+#
+# 默认关闭，关闭时 stage() 返回一个什么都不做的对象，被 instrument 装饰的函数直接调用原函数。
+# 开启方式：
+#   - 调用 enable(log_filepath, metrics_filepath)
+#   - 或设置环境变量 MOVIES_METRICS_LOG / MOVIES_METRICS_FILE，导入时自动开启
+# log_filepath 为 json lines 日志，每个阶段结束时追加一行；metrics_filepath 在程序退出时写入汇总的指标。
+
+# 直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+enabled = False
+log_filepath = None
+metrics_filepath = None
+
+lock = threading.Lock()
+local = threading.local()
+stages = {}
+counters = {}
+histograms = {}
+log_file = None
+exit_registered = False
+
+
+# 当前进程的内存峰值（MB），无法统计时返回 nan
+def peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位是字节，Linux 上单位是 KB
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class Histogram:
+    """
+    固定桶的直方图，记录次数、总和、最小最大值和每个桶的次数。
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    # 分位数的估计值：所在桶的上界（最后一个桶取最大值）
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {('inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class Stage:
+    """
+    一个阶段的一次运行，作为上下文管理器使用：
+
+        with stage('read', rows_in=len(frame)) as record:
+            ...
+            record.rows_out = len(result)
+
+    阶段内抛出的异常计入 errors 后继续抛出；被捕获的异常可以用 record_error() 计入当前阶段。
+
+    内存有两个字段，都来自进程的 ru_maxrss（进程启动以来的内存峰值，不会下降）：
+    - peak_growth_mb：阶段运行期间进程内存峰值的增加量，即该阶段把峰值推高了多少；
+      阶段内的内存一直低于之前的峰值时为0，不表示该阶段没有分配内存
+    - process_peak_mb：阶段结束时整个进程的内存峰值，包含之前所有阶段，不能按阶段相加或比较
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.errors = 0
+
+    def __enter__(self):
+        stack = getattr(local, 'stack', None)
+        if stack is None:
+            stack = local.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.peak_before = peak_rss_mb()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        peak = peak_rss_mb()
+        local.stack.pop()
+        if exc_type is not None:
+            self.errors += 1
+        finish_stage({
+            'event': 'stage',
+            'name': self.name,
+            'parent': self.parent,
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(cpu, 6),
+            'peak_growth_mb': round(peak - self.peak_before, 1),
+            'process_peak_mb': round(peak, 1),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'errors': self.errors,
+            'time': time.time(),
+        })
+        return False
+
+
+class NullStage:
+    """
+    关闭时使用的阶段对象，不记录任何数据。
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+def stage(name, rows_in=None):
+    return Stage(name, rows_in) if enabled else NULL_STAGE
+
+
+# 数据的行数：DataFrame/Series/ndarray 取第一维，列表取长度，其他返回 None
+def count_rows(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    if isinstance(value, list):
+        return len(value)
+    return None
+
+
+def instrument(name=None):
+    """
+    装饰器：开启时把函数的每次调用记录为一个阶段，输入行数取第一个参数、输出行数取返回值。
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Stage(stage_name, count_rows(args[0]) if args else None) as record:
+                result = func(*args, **kwargs)
+                rows_out = count_rows(result)
+                if rows_out is not None:
+                    record.rows_out = rows_out
+                return result
+        return wrapper
+    return decorator
+
+
+def current_stage():
+    stack = getattr(local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+# 设置当前阶段的输入输出行数，用于从文件读取数据的函数
+def set_rows(rows_in=None, rows_out=None):
+    if not enabled:
+        return
+    record = current_stage()
+    if record is None:
+        return
+    if rows_in is not None:
+        record.rows_in = int(rows_in)
+    if rows_out is not None:
+        record.rows_out = int(rows_out)
+
+
+# 记录一个被捕获的错误，计入当前阶段和 errors.<阶段名> 计数器
+def record_error(error=None, count=1):
+    if not enabled:
+        return
+    record = current_stage()
+    name = record.name if record is not None else 'unknown'
+    if record is not None:
+        record.errors += count
+    increment(f"errors.{name}", count)
+    if error is not None:
+        log({'event': 'error', 'stage': name, 'error': f"{type(error).__name__}: {error}", 'time': time.time()})
+
+
+def increment(name, value=1):
+    if not enabled:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS):
+    if not enabled:
+        return
+    with lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(buckets)
+        histogram.observe(value)
+
+
+# 汇总一个阶段的结果，并写入日志
+def finish_stage(entry):
+    with lock:
+        totals = stages.get(entry['name'])
+        if totals is None:
+            totals = stages[entry['name']] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                              'peak_growth_mb': 0.0, 'process_peak_mb': 0.0,
+                                              'rows_in': 0, 'rows_out': 0, 'errors': 0}
+        totals['calls'] += 1
+        totals['wall_seconds'] += entry['wall_seconds']
+        totals['cpu_seconds'] += entry['cpu_seconds']
+        totals['peak_growth_mb'] = max(totals['peak_growth_mb'], entry['peak_growth_mb'])
+        totals['process_peak_mb'] = max(totals['process_peak_mb'], entry['process_peak_mb'])
+        totals['rows_in'] += entry['rows_in'] or 0
+        totals['rows_out'] += entry['rows_out'] or 0
+        totals['errors'] += entry['errors']
+    log(entry)
+
+
+def log(entry):
+    if log_file is None:
+        return
+    line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+    with lock:
+        log_file.write(line)
+        log_file.flush()
+
+
+def snapshot():
+    with lock:
+        return {
+            'stages': {name: dict(totals) for name, totals in stages.items()},
+            'counters': dict(counters),
+            'histograms': {name: histogram.snapshot() for name, histogram in histograms.items()},
+        }
+
+
+# 把汇总的指标写入 json 文件（先写临时文件再替换）
+def write_metrics(filepath=None):
+    filepath = filepath or metrics_filepath
+    if not filepath:
+        return None
+    metrics = snapshot()
+    temp_filepath = f"{filepath}.tmp"
+    with open(temp_filepath, 'w', encoding='utf-8') as file:
+        json.dump(metrics, file, indent=2, ensure_ascii=False)
+    os.replace(temp_filepath, filepath)
+    return metrics
+
+
+def enable(log_path=None, metrics_path=None):
+    """
+    开启记录。
+
+    参数：
+    - log_path: str, 可选
+        json lines 日志文件，每个阶段结束和每个错误追加一行。
+    - metrics_path: str, 可选
+        程序退出时写入汇总指标的 json 文件，也可以随时调用 write_metrics()。
+    """
+    global enabled, log_filepath, metrics_filepath, log_file, exit_registered
+    with lock:
+        if log_file is not None:
+            log_file.close()
+        log_filepath = log_path
+        metrics_filepath = metrics_path
+        log_file = open(log_path, 'a', encoding='utf-8') if log_path else None
+        if metrics_path and not exit_registered:
+            atexit.register(write_metrics)
+            exit_registered = True
+        enabled = True
+
+
+def disable():
+    global enabled, log_file
+    with lock:
+        enabled = False
+        if log_file is not None:
+            log_file.close()
+            log_file = None
+
+
+# 清空已记录的数据
+def reset():
+    with lock:
+        stages.clear()
+        counters.clear()
+        histograms.clear()
+
+
+if os.environ.get('MOVIES_METRICS_LOG') or os.environ.get('MOVIES_METRICS_FILE'):
+    enable(os.environ.get('MOVIES_METRICS_LOG'), os.environ.get('MOVIES_METRICS_FILE'))
@@ -0,0 +1,138 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# 倒排索引：从类型、导演、演员、关键词、制片公司到电影id的映射
+#
+# 每个字段的所有取值编码为整数 term id，保存为三个文件：
+# - {field}_terms.json：term 列表，下标即 term id
+# - {field}_offsets.npy：int64，长度为 term 数 + 1，第 i 个 term 的电影id位于 postings[offsets[i]:offsets[i + 1]]
+# - {field}_postings.npy：int32，按 term 分段、段内升序排列的电影id
+# npy 文件以内存映射方式加载，查询时只读取用到的部分
+
+# movies.csv 中用'|'分隔的字段
+INDEX_FIELDS = ['genres', 'director', 'actor', 'production_companies']
+
+
+# 将 (电影id, 取值) 对编码为 terms、offsets、postings
+def build_postings(movie_ids, values):
+    movie_ids = pd.to_numeric(pd.Series(movie_ids), errors='coerce')
+    values = pd.Series(values, index=movie_ids.index)
+    valid = movie_ids.notna() & values.notna() & (values.astype(str) != '')
+    movie_ids = movie_ids[valid].astype(np.int32).to_numpy()
+    values = values[valid].astype(str).to_numpy()
+
+    # sort=True 使 term id 按字典序排列
+    codes, terms = pd.factorize(values, sort=True)
+    order = np.lexsort((movie_ids, codes))
+    codes = codes[order]
+    movie_ids = movie_ids[order]
+
+    # 去掉重复的 (term, 电影id)
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = (codes[1:] != codes[:-1]) | (movie_ids[1:] != movie_ids[:-1])
+    codes = codes[keep]
+    postings = movie_ids[keep]
+
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(terms)), out=offsets[1:])
+    return list(terms), offsets, postings
+
+
+# 把用'|'分隔的字段展开成 (电影id, 取值) 对
+def explode_column(movies, column):
+    values = movies[column].astype(object).str.split('|')
+    exploded = pd.DataFrame({'id': movies['id'], 'value': values}).explode('value')
+    return exploded['id'], exploded['value']
+
+
+def build_index(movies, output_dir, keywords=None, fields=INDEX_FIELDS):
+    """
+    从处理后的 movies 数据（以及 keywords 数据）构建倒排索引并写入 output_dir。
+
+    参数：
+    - movies: DataFrame
+        处理后的 movies 数据，包含 id 和 fields 中的字段。
+    - output_dir: str
+        索引文件的输出目录。
+    - keywords: DataFrame, 可选
+        handle_keywords 输出的关键词数据（movieId, userId, tag），用于构建 keywords 字段。
+    - fields: list of str, 可选
+        需要建立索引的 movies 字段。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sources = {field: explode_column(movies, field) for field in fields if field in movies.columns}
+    if keywords is not None:
+        sources['keywords'] = (keywords['movieId'], keywords['tag'])
+
+    for field, (movie_ids, values) in sources.items():
+        terms, offsets, postings = build_postings(movie_ids, values)
+        with open(os.path.join(output_dir, f"{field}_terms.json"), 'w', encoding='utf-8') as file:
+            json.dump(terms, file, ensure_ascii=False)
+        np.save(os.path.join(output_dir, f"{field}_offsets.npy"), offsets)
+        np.save(os.path.join(output_dir, f"{field}_postings.npy"), postings)
+
+    with open(os.path.join(output_dir, 'fields.json'), 'w', encoding='utf-8') as file:
+        json.dump(list(sources), file)
+
+
+class InvertedIndex:
+    """
+    加载 build_index 输出的索引并查询。
+
+    用法：
+        index = InvertedIndex('./movie_index')
+        index.lookup('actor', 'Tom Hanks')
+        index.all_of(('genres', 'Comedy'), ('director', 'John Lasseter'))
+        index.any_of(('keywords', 'jealousy'), ('keywords', 'toy'))
+    查询结果都是升序排列的 int32 电影id数组。
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'fields.json'), 'r', encoding='utf-8') as file:
+            self.fields = json.load(file)
+
+        self.terms = {}
+        self.offsets = {}
+        self.postings = {}
+        for field in self.fields:
+            with open(os.path.join(index_dir, f"{field}_terms.json"), 'r', encoding='utf-8') as file:
+                self.terms[field] = {term: term_id for term_id, term in enumerate(json.load(file))}
+            self.offsets[field] = np.load(os.path.join(index_dir, f"{field}_offsets.npy"), mmap_mode='r')
+            self.postings[field] = np.load(os.path.join(index_dir, f"{field}_postings.npy"), mmap_mode='r')
+
+    # 某个字段取值为 term 的所有电影id，不存在时返回空数组
+    def lookup(self, field, term):
+        if field not in self.terms:
+            raise KeyError(f"Field '{field}' is not indexed")
+        term_id = self.terms[field].get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32)
+        offsets = self.offsets[field]
+        return np.asarray(self.postings[field][offsets[term_id]:offsets[term_id + 1]])
+
+    # 同时满足所有条件的电影id（AND），从最短的列表开始求交集
+    def all_of(self, *conditions):
+        results = sorted((self.lookup(field, term) for field, term in conditions), key=len)
+        if not results:
+            return np.empty(0, dtype=np.int32)
+        result = results[0]
+        for postings in results[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, postings, assume_unique=True)
+        return result
+
+    # 满足任一条件的电影id（OR）
+    def any_of(self, *conditions):
+        results = [self.lookup(field, term) for field, term in conditions]
+        if not results:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(results))
+
+    # 某个字段的所有取值
+    def terms_of(self, field):
+        return list(self.terms[field])
@@ -0,0 +1,149 @@
+import ast
+import re
+
+import pandas as pd
+
+# 批量解析数据集中以 Python 字面量形式保存的 json 字段
+# (genres, crew, cast, keywords, production_companies ...)
+#
+# 这些字段的每个单元格都是 "[{'id': 16, 'name': 'Animation'}, ...]" 这样的字符串，
+# 列表里只有一层字典，字典的值只有字符串、数字、None、True/False。
+# 用一个正则一次扫描整个单元格，只取出需要的键，不需要对整个字符串执行 eval()，
+# 既安全又比逐行 eval 快得多。
+
+# 匹配 "{"（一个新字典的开始）或者 "'键': 值"
+# 字符串值作为一个整体被匹配，所以字符串内部出现的 "{" 或 "'name':" 不会被误判
+TOKEN_PATTERN = re.compile(
+    r"""\{|'(\w+)':\s*('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|[^,}\]]+)"""
+)
+
+LITERALS = {'None': None, 'True': True, 'False': False}
+
+
+# 将匹配到的值转换为 Python 对象
+def decode_value(token):
+    first = token[0]
+    if first == "'" or first == '"':
+        inner = token[1:-1]
+        # 只有包含转义字符时才需要交给 literal_eval
+        return ast.literal_eval(token) if '\\' in inner else inner
+
+    token = token.strip()
+    if token in LITERALS:
+        return LITERALS[token]
+    try:
+        return int(token)
+    except ValueError:
+        try:
+            return float(token)
+        except ValueError:
+            return token
+
+
+def parse_records(cell, fields=None):
+    """
+    解析一个单元格，返回字典列表。
+
+    参数：
+    - cell: str
+        形如 "[{'id': 16, 'name': 'Animation'}]" 的字符串，非字符串（空值）返回空列表。
+    - fields: 可迭代的 str, 可选
+        只保留这些键，默认保留全部键。
+    """
+    if not isinstance(cell, str):
+        return []
+
+    wanted = None if fields is None else frozenset(fields)
+    records = []
+    record = None
+    for key, token in TOKEN_PATTERN.findall(cell):
+        if not key:
+            record = {}
+            records.append(record)
+        elif record is not None and (wanted is None or key in wanted):
+            record[key] = decode_value(token)
+    return records
+
+
+def parse_column(series, fields=None):
+    """
+    批量解析一整列，返回与 series 索引一致的 Series，每个元素是字典列表。
+    非字符串（空值）保持原值，与 `eval(x) if isinstance(x, str) else x` 的行为一致。
+    """
+    wanted = None if fields is None else tuple(fields)
+    return pd.Series(
+        [parse_records(cell, wanted) if isinstance(cell, str) else cell for cell in series],
+        index=series.index,
+        dtype=object,
+    )
+
+
+def extract_values(cell, key='name', sep='|', limit=None, where=None):
+    """
+    从单元格中取出每个字典 key 对应的值并用 sep 连接。
+
+    参数：
+    - limit: int, 可选
+        只取前 limit 个字典（例如 cast 只取前15个演员）。
+    - where: (str, object), 可选
+        只保留 record[where[0]] == where[1] 的字典（例如 crew 中 job == 'Director'）。
+    """
+    if not isinstance(cell, str):
+        return ''
+
+    # 直接遍历匹配结果，不为每个字典创建对象
+    # 有 limit 时用 finditer，取够数量后就不再扫描剩下的字符串
+    where_key, where_value = where if where is not None else (None, None)
+    tokens = TOKEN_PATTERN.findall(cell) if limit is None else (m.groups() for m in TOKEN_PATTERN.finditer(cell))
+    values = []
+    found = matched = False
+    value = None
+    count = 0
+    for token_key, token in tokens:
+        if not token_key:
+            if found and (where is None or matched):
+                values.append(value)
+            count += 1
+            if limit is not None and count > limit:
+                found = False
+                break
+            found = matched = False
+        elif token_key == key:
+            value = decode_value(token)
+            found = True
+        elif token_key == where_key:
+            matched = decode_value(token) == where_value
+    if found and (where is None or matched):
+        values.append(value)
+    return sep.join(str(value) for value in values)
+
+
+def iter_records(cell, keys):
+    """
+    逐个返回单元格中每个字典 keys 对应的值组成的元组（缺少的键为 None），不为每个字典创建对象。
+    非字符串（空值）不返回任何内容。
+    """
+    if not isinstance(cell, str):
+        return
+    positions = {key: i for i, key in enumerate(keys)}
+    values = None
+    for token_key, token in TOKEN_PATTERN.findall(cell):
+        if not token_key:
+            if values is not None:
+                yield tuple(values)
+            values = [None] * len(keys)
+        elif values is not None and token_key in positions:
+            values[positions[token_key]] = decode_value(token)
+    if values is not None:
+        yield tuple(values)
+
+
+def join_column(series, key='name', sep='|', limit=None, where=None):
+    """
+    批量处理一整列，返回用 sep 连接后的字符串 Series，空值变为空字符串。
+    """
+    return pd.Series(
+        [extract_values(cell, key, sep, limit, where) for cell in series],
+        index=series.index,
+        dtype=object,
+    )
@@ -0,0 +1,225 @@
+import os
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from jsonParser import iter_records
+
+# 关键词、演员、剧组的规范化存储：
+# 每种取值（人名、关键词、职位、角色名）放进一个词典，编码为整数 term id；
+# 电影与取值的关系保存为等长的 int32 数组（边表），例如 cast 边表为 movie_id、person、character、order 四个数组。
+# 构建时直接把整数追加到 array 中，不为每条关系创建 dict，整体序列化为一个 .npz 文件。
+
+
+class TermDictionary:
+    """
+    字符串到连续整数 id 的映射。
+    """
+
+    def __init__(self, terms=()):
+        self.ids = {}
+        self.terms = []
+        for term in terms:
+            self.add(term)
+
+    def add(self, term):
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, term_id):
+        return self.terms[term_id]
+
+    # 序列化为 UTF-8 字节数组和 int64 偏移数组
+    def to_arrays(self):
+        encoded = [term.encode('utf-8') for term in self.terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+    @classmethod
+    def from_arrays(cls, data, offsets):
+        data = bytes(data)
+        return cls(data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:]))
+
+    def nbytes(self):
+        data, offsets = self.to_arrays()
+        return data.nbytes + offsets.nbytes
+
+
+class NormalizedStore:
+    """
+    参数：
+    - dictionaries: dict
+        词典名 -> TermDictionary，包括 keyword、person、job、character。
+    - edges: dict
+        边表名 -> {列名: numpy 数组}，包括 keywords、cast、crew。
+    """
+
+    # 每个边表的列以及列对应的词典（None 表示普通整数列）
+    SCHEMA = {
+        'keywords': {'movie_id': None, 'keyword': 'keyword', 'keyword_id': None},
+        'cast': {'movie_id': None, 'person': 'person', 'character': 'character', 'order': None},
+        'crew': {'movie_id': None, 'person': 'person', 'job': 'job'},
+    }
+
+    def __init__(self, dictionaries=None, edges=None):
+        self.dictionaries = dictionaries or {name: TermDictionary() for name in ('keyword', 'person', 'job', 'character')}
+        self.edges = edges or {}
+
+    # 把一列 json 字符串中的关系追加到边表，keys 为每个字典需要取出的键，columns 为对应的边表列
+    # where 为 (列名, 允许的取值集合)，在编码之前过滤，不保留的关系不会把取值加入词典
+    def add_edges(self, table, movie_ids, cells, keys, columns, limit=None, where=None):
+        schema = self.SCHEMA[table]
+        buffers = {column: array('i') for column in schema}
+        encoders = [self.dictionaries[schema[column]].add if schema[column] else None for column in columns]
+        where_position, where_values = (columns.index(where[0]), where[1]) if where is not None else (None, None)
+
+        movie_ids = pd.to_numeric(pd.Series(movie_ids), errors='coerce').to_numpy()
+        for movie_id, cell in zip(movie_ids, cells):
+            if movie_id != movie_id:
+                # id 不是数字的异常行
+                continue
+            for position, values in enumerate(iter_records(cell, keys)):
+                if limit is not None and position >= limit:
+                    break
+                if where is not None and values[where_position] not in where_values:
+                    continue
+                buffers['movie_id'].append(int(movie_id))
+                if 'order' in buffers:
+                    buffers['order'].append(position)
+                for column, encode, value in zip(columns, encoders, values):
+                    if encode is not None:
+                        value = encode('' if value is None else str(value))
+                    buffers[column].append(-1 if value is None else int(value))
+
+        self.append_edges(table, {column: np.frombuffer(buffer, dtype=np.int32) if len(buffer)
+                                  else np.empty(0, dtype=np.int32) for column, buffer in buffers.items()})
+
+    # 把新的边追加到边表末尾
+    def append_edges(self, table, new_edges):
+        if table in self.edges:
+            new_edges = {column: np.concatenate([self.edges[table][column], values])
+                         for column, values in new_edges.items()}
+        self.edges[table] = new_edges
+
+    # 从原始 keywords.csv（id, keywords）构建关键词边表
+    def add_keywords(self, keywords):
+        self.add_edges('keywords', keywords['id'], keywords['keywords'], ('name', 'id'), ('keyword', 'keyword_id'))
+
+    # 从 handle_keywords 输出的关键词数据（movieId, userId, tag）构建关键词边表，userId 为关键词 id
+    # 已经是一行一条关系，每个不同的 tag 只编码一次
+    def add_keyword_rows(self, keywords):
+        movie_ids = pd.to_numeric(keywords['movieId'], errors='coerce')
+        # id 不是数字的异常行
+        keywords = keywords[movie_ids.notna().to_numpy()]
+        codes, tags = pd.factorize(keywords['tag'].fillna('').astype(str))
+        term_ids = np.array([self.dictionaries['keyword'].add(tag) for tag in tags], dtype=np.int32)
+        self.append_edges('keywords', {
+            'movie_id': movie_ids.dropna().to_numpy(dtype=np.int32),
+            'keyword': term_ids[codes] if len(codes) else np.empty(0, dtype=np.int32),
+            'keyword_id': pd.to_numeric(keywords['userId'], errors='coerce').fillna(-1).to_numpy(dtype=np.int32),
+        })
+
+    # 从原始 credits.csv（cast, crew, id）构建演员和剧组边表
+    # cast_limit 限制每部电影保留的演员数，crew_jobs 只保留这些职位的剧组成员
+    def add_credits(self, credits, cast_limit=None, crew_jobs=None):
+        self.add_edges('cast', credits['id'], credits['cast'], ('name', 'character'), ('person', 'character'),
+                       limit=cast_limit)
+        self.add_edges('crew', credits['id'], credits['crew'], ('name', 'job'), ('person', 'job'),
+                       where=('job', frozenset(crew_jobs)) if crew_jobs is not None else None)
+
+    # 把边表还原成可读的 DataFrame，词典编码的列还原为字符串
+    def to_frame(self, table):
+        schema = self.SCHEMA[table]
+        columns = {}
+        for column, dictionary in schema.items():
+            values = self.edges[table][column]
+            if dictionary:
+                terms = np.array(self.dictionaries[dictionary].terms, dtype=object)
+                values = terms[values] if len(terms) else values.astype(object)
+            columns[column] = values
+        return pd.DataFrame(columns)
+
+    def nbytes(self):
+        return (sum(dictionary.nbytes() for dictionary in self.dictionaries.values())
+                + sum(values.nbytes for table in self.edges.values() for values in table.values()))
+
+    def save(self, filepath):
+        arrays = {}
+        for name, dictionary in self.dictionaries.items():
+            arrays[f"terms/{name}/data"], arrays[f"terms/{name}/offsets"] = dictionary.to_arrays()
+        for table, columns in self.edges.items():
+            for column, values in columns.items():
+                arrays[f"edges/{table}/{column}"] = values
+        np.savez(filepath, **arrays)
+
+    @classmethod
+    def load(cls, filepath):
+        dictionaries = {}
+        edges = {}
+        with np.load(filepath) as arrays:
+            for key in arrays.files:
+                kind, name, field = key.split('/')
+                if kind == 'terms' and field == 'data':
+                    dictionaries[name] = TermDictionary.from_arrays(arrays[key], arrays[f"terms/{name}/offsets"])
+                elif kind == 'edges':
+                    edges.setdefault(name, {})[field] = arrays[key]
+        return cls(dictionaries, edges)
+
+
+# 从原始 keywords.csv 和 credits.csv 构建规范化存储并保存
+def build_store(keywords_filepath, credits_filepath, output_filepath, cast_limit=None, crew_jobs=None):
+    store = NormalizedStore()
+    store.add_keywords(pd.read_csv(keywords_filepath))
+    store.add_credits(pd.read_csv(credits_filepath, usecols=['cast', 'crew', 'id']), cast_limit, crew_jobs)
+    store.save(output_filepath)
+    return store
+
+
+# 从 run_pipeline 中转换类型、去重后的数据（id, cast, crew）和 handle_keywords 的输出构建规范化存储，
+# 默认与 movies.csv 保持相同的内容（前15个演员、只保留导演）
+def store_from_movies(movies, keywords=None, cast_limit=15, crew_jobs=('Director',)):
+    store = NormalizedStore()
+    credits = pd.DataFrame({'id': movies['id'].astype('int64').to_numpy(),
+                            'cast': movies['cast'].to_numpy(), 'crew': movies['crew'].to_numpy()})
+    store.add_credits(credits, cast_limit, crew_jobs)
+    if keywords is not None:
+        store.add_keyword_rows(keywords)
+    return store
+
+
+# 对比规范化存储和 keywords.csv、movies.csv 中对应字段的内存占用和文件大小
+def memory_report(store, store_filepath, keywords_filepath="./keywords.csv", movies_filepath="./movies.csv"):
+    rows = []
+    if os.path.exists(keywords_filepath):
+        keywords = pd.read_csv(keywords_filepath)
+        rows.append(('keywords.csv', keywords.memory_usage(deep=True).sum(), os.path.getsize(keywords_filepath)))
+    if os.path.exists(movies_filepath):
+        movies = pd.read_csv(movies_filepath, usecols=['director', 'actor', 'character'])
+        rows.append(('movies.csv (director, actor, character)', movies.memory_usage(deep=True).sum(), None))
+    if len(rows) > 1:
+        rows.append(('total', sum(row[1] for row in rows), None))
+    rows.append(('normalized store', store.nbytes(), os.path.getsize(store_filepath)))
+
+    for name, memory, size in rows:
+        size = f"{size / 1024 / 1024:.2f} MB" if size is not None else '-'
+        print(f"{name:<48}memory {memory / 1024 / 1024:>8.2f} MB   file {size}")
+    for table, columns in store.edges.items():
+        print(f"  {table}: {len(columns['movie_id'])} edges")
+    for name, dictionary in store.dictionaries.items():
+        print(f"  {name}: {len(dictionary)} terms")
+    return rows
+
+
+if __name__ == "__main__":
+    # 与 movies.csv 保持相同的内容（前15个演员、只保留导演），便于对比
+    store = build_store("../archive/keywords.csv", "./credits.csv", "./credits_store.npz",
+                        cast_limit=15, crew_jobs=['Director'])
+    memory_report(store, "./credits_store.npz")
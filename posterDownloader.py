@@ -0,0 +1,251 @@
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import increment, instrument, observe, record_error, set_rows
+from tableIO import read_table, write_table
+from tmdbClient import Checkpoint, TokenBucket, call_with_retries, run_bounded
+
+# 下载 poster_path.csv 中的海报图片：
+# - poster_path 可以是 '/abc.jpg' 形式的相对路径，也可以是 API_poster_path.py 写出的完整 url
+# - 同一张图片（相同 url）只下载一次，图片按尺寸保存到 output_dir/<size>/<url 的哈希>-<文件名>，
+#   不同来源的同名图片不会互相覆盖
+# - 响应边读边写入 .part 临时文件，完成后再重命名，不会把整张图片读入内存，也不会留下不完整的文件
+# - 已完成的下载按 url 记录在 manifest（json lines，格式同 Checkpoint）中，包括 ETag，重新运行时跳过
+
+IMAGE_BASE_URL = "https://image.tmdb.org/t/p"
+
+# TMDB 支持的海报尺寸
+SIZES = ('w92', 'w154', 'w185', 'w342', 'w500', 'w780', 'original')
+
+
+# poster_path 对应的图片 url；TMDB 的完整 url（.../t/p/<尺寸>/<文件名>）只取文件名，按 base_url 和 size 重新拼接
+def poster_url(poster_path, size='original', base_url=IMAGE_BASE_URL):
+    if size not in SIZES:
+        raise ValueError(f"Unsupported poster size: {size}")
+    if poster_path.startswith(('http://', 'https://')):
+        _, sep, rest = poster_path.partition('/t/p/')
+        if not sep:
+            # 其他来源的完整 url 原样使用
+            return poster_path
+        poster_path = rest.split('/', 1)[-1]
+    return f"{base_url.rstrip('/')}/{size}/{poster_path.lstrip('/')}"
+
+
+# 从 poster_path 文件中读取去重后的图片路径，空值跳过
+def read_poster_paths(filepath):
+    posters = read_table(filepath, columns=['id', 'poster_path'], dtype=str)
+    posters = posters.dropna(subset=['poster_path'])
+    return posters[posters['poster_path'].str.strip() != '']
+
+
+class PosterDownloader:
+    """
+    参数：
+    - output_dir: str
+        图片的保存目录。
+    - size: str, 可选
+        图片尺寸，w92/w154/w185/w342/w500/w780/original。
+    - base_url: str, 可选
+        相对路径的图片地址前缀，测试时可以指向本地的文件服务器。
+    - concurrency: int, 可选
+        并发下载数，同时也是连接池的大小。
+    - rate: float, 可选
+        每秒最多发出的请求数，None 表示不限速。
+    - max_retries: int, 可选
+        遇到 429/5xx、连接错误或下载中途连接中断时的最大重试次数。
+    - backoff: float, 可选
+        第 n 次重试前等待 backoff * 2**n 秒。
+    - timeout: float, 可选
+        连接和两次读取之间的超时时间（秒）。
+    - chunk_size: int, 可选
+        每次从响应读取并写入文件的字节数。
+    - revalidate: bool, 可选
+        为 True 时已下载的图片也会带上 If-None-Match 请求，服务器返回 304 时跳过，否则重新下载；
+        默认为 False，已下载的图片不再请求。
+    """
+
+    def __init__(self, output_dir, size='original', base_url=IMAGE_BASE_URL, concurrency=16, rate=None,
+                 max_retries=3, backoff=0.5, timeout=30, chunk_size=64 * 1024, revalidate=False):
+        if size not in SIZES:
+            raise ValueError(f"Unsupported poster size: {size}")
+        self.output_dir = output_dir
+        self.size = size
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate) if rate else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.revalidate = revalidate
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.lock = threading.Lock()
+        self.summary = {'downloaded': 0, 'not_modified': 0, 'skipped': 0, 'errors': 0, 'bytes': 0}
+
+    # 图片在本地的保存路径，文件名前加上完整 url 的哈希，保留原文件名便于查看
+    def local_path(self, url):
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()
+        name = urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]
+        return os.path.join(self.output_dir, self.size, f"{digest}-{name}")
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.summary[key] += value
+
+    # 下载一张图片，返回 manifest 记录；304 时返回原来的记录，失败时抛出最后一次的异常
+    def download(self, url, entry=None):
+        filepath = self.local_path(url)
+        headers = {}
+        if entry and entry.get('etag') and os.path.exists(filepath):
+            headers['If-None-Match'] = entry['etag']
+
+        # 写入文件也在每次尝试之内，下载中途连接中断（ChunkedEncodingError）时会重新下载
+        def attempt():
+            start = time.perf_counter()
+            with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304:
+                    self.count('not_modified')
+                    return entry
+                response.raise_for_status()
+                written = self.write_stream(response, filepath)
+                observe('poster.download_seconds', time.perf_counter() - start)
+                increment('poster.bytes', written)
+                self.count('downloaded')
+                self.count('bytes', written)
+                return {'path': os.path.relpath(filepath, self.output_dir),
+                        'etag': response.headers.get('ETag'), 'bytes': written}
+
+        return call_with_retries(attempt, self.max_retries, self.backoff, self.limiter,
+                                 lambda attempt_number, error: increment('poster.retries'))
+
+    # 把响应逐块写入临时文件，完成后重命名为目标文件，返回写入的字节数
+    def write_stream(self, response, filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_filepath = f"{filepath}.part"
+        written = 0
+        try:
+            with open(tmp_filepath, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    file.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_filepath, filepath)
+        finally:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+        return written
+
+    @instrument('download_posters')
+    def download_all(self, poster_paths, manifest_filepath=None, report_interval=10):
+        """
+        并发下载所有图片，同时在途的下载不超过并发数的4倍。
+
+        参数：
+        - poster_paths: 可迭代的 str
+            poster_path 列表，可以有重复。
+        - manifest_filepath: str, 可选
+            记录已下载图片的文件，默认为 output_dir/<size>/manifest.jsonl。
+
+        返回下载数 downloaded、未变化数 not_modified、跳过数 skipped、失败数 errors 和下载的字节数 bytes。
+        """
+        manifest_filepath = manifest_filepath or os.path.join(self.output_dir, self.size, 'manifest.jsonl')
+        os.makedirs(os.path.dirname(manifest_filepath), exist_ok=True)
+        urls = list(dict.fromkeys(poster_url(path, self.size, self.base_url) for path in poster_paths))
+        set_rows(rows_in=len(urls))
+
+        with Checkpoint(manifest_filepath) as manifest, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = []
+            for url in urls:
+                # manifest 中有记录且文件存在的图片不需要下载
+                if url in manifest and os.path.exists(self.local_path(url)) and not self.revalidate:
+                    self.count('skipped')
+                else:
+                    pending.append(url)
+
+            last = time.monotonic()
+            done = 0
+            for url, future in run_bounded(executor, lambda url: self.download(url, manifest.done.get(url)),
+                                           pending, self.concurrency * 4):
+                done += 1
+                try:
+                    entry = future.result()
+                    # 304 时记录没有变化，不需要再写入 manifest
+                    if entry is not manifest.done.get(url):
+                        manifest.mark(url, entry)
+                except Exception as e:
+                    self.count('errors')
+                    record_error(e)
+                    print(f"Error occurred while downloading {url}: {e}")
+
+                now = time.monotonic()
+                if now - last >= report_interval:
+                    last = now
+                    print(f"{done}/{len(pending)} posters, {self.summary['bytes'] / 1024 / 1024:.1f} MB")
+
+        set_rows(rows_out=self.summary['downloaded'] + self.summary['not_modified'])
+        print(f"Downloaded {self.summary['downloaded']} posters ({self.summary['bytes'] / 1024 / 1024:.1f} MB), "
+              f"{self.summary['not_modified']} not modified, {self.summary['skipped']} skipped, "
+              f"{self.summary['errors']} errors")
+        return dict(self.summary)
+
+    def close(self):
+        self.session.close()
+
+
+def download_posters(poster_filepath="./poster_path.csv", output_dir="./posters", size='w500',
+                     base_url=IMAGE_BASE_URL, index_filepath=None, **kwargs):
+    """
+    下载 poster_path 文件中所有电影的海报。
+
+    参数：
+    - poster_filepath: str, 可选
+        data_processing 或 API_poster_path.py 写出的文件，包含 id 和 poster_path 两列。
+    - output_dir: str, 可选
+        图片的保存目录，图片保存在 output_dir/<size>/ 下。
+    - size: str, 可选
+        图片尺寸。
+    - base_url: str, 可选
+        相对路径的图片地址前缀。
+    - index_filepath: str, 可选
+        指定时写出电影 id 到本地图片路径（相对 output_dir）的对应表，下载失败的电影不写入。
+    - kwargs:
+        传给 PosterDownloader 的其他参数。
+
+    返回下载统计。
+    """
+    try:
+        posters = read_poster_paths(poster_filepath)
+        downloader = PosterDownloader(output_dir, size, base_url, **kwargs)
+        try:
+            summary = downloader.download_all(posters['poster_path'])
+        finally:
+            downloader.close()
+
+        if index_filepath:
+            urls = posters['poster_path'].map(lambda path: poster_url(path, size, base_url))
+            paths = urls.map(lambda url: os.path.relpath(downloader.local_path(url), output_dir))
+            exists = paths.map(lambda path: os.path.exists(os.path.join(output_dir, path)))
+            write_table(pd.DataFrame({'id': posters['id'], 'path': paths})[exists.to_numpy()], index_filepath)
+        return summary
+    except Exception as e:
+        print(f"Error occurred while downloading posters: {e}")
+        record_error(e)
+        return None
+
+
+if __name__ == "__main__":
+    # 下载 w500 尺寸的海报，中断后重新运行会跳过已下载的图片
+    download_posters("./poster_path.csv", "./posters", size='w500', index_filepath="./poster_files.csv")
@@ -0,0 +1,178 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy import sparse
+except ImportError:  # 只有 to_scipy 需要 scipy
+    sparse = None
+
+from instrumentation import instrument, set_rows
+from tableIO import format_of, read_table
+
+# 用户-电影评分的稀疏矩阵，同时保存 CSR（按用户）和 CSC（按电影）两种布局：
+# - user_ids.npy / movie_ids.npy：int32，升序排列的用户id和电影id，下标即矩阵的行号和列号
+# - csr_indptr.npy：int64，第 i 个用户的评分位于 csr_indices/csr_data 的 [indptr[i], indptr[i + 1])
+# - csr_indices.npy：int32，列号（电影），每行内升序；csr_data.npy：float32，评分
+# - csc_indptr.npy、csc_indices.npy（行号，用户）、csc_data.npy：按电影排列的同一份数据
+# 所有文件都是 .npy，以内存映射方式加载，按用户或电影取评分时只读取对应的一段。
+
+RATING_COLUMNS = ['userId', 'movieId', 'rating']
+RATING_DTYPES = {'userId': 'int32', 'movieId': 'int32', 'rating': 'float32'}
+ARRAYS = ['user_ids', 'movie_ids', 'csr_indptr', 'csr_indices', 'csr_data', 'csc_indptr', 'csc_indices', 'csc_data']
+
+
+# 读取评分数据的 userId、movieId、rating 三列；csv 分块读取，每块只保留三列的 numpy 数组
+def read_triples(ratings_filepath, chunksize=1000000):
+    if format_of(ratings_filepath) != 'csv':
+        ratings = read_table(ratings_filepath, columns=RATING_COLUMNS).astype(RATING_DTYPES)
+        return tuple(ratings[column].to_numpy() for column in RATING_COLUMNS)
+
+    parts = {column: [] for column in RATING_COLUMNS}
+    for ratings in pd.read_csv(ratings_filepath, usecols=RATING_COLUMNS, dtype=RATING_DTYPES, chunksize=chunksize):
+        for column in RATING_COLUMNS:
+            parts[column].append(ratings[column].to_numpy())
+    return tuple(np.concatenate(values) if values else np.empty(0, dtype=RATING_DTYPES[column])
+                 for column, values in parts.items())
+
+
+# 把按 (主键, 次键) 排好序的编码转换为 indptr
+def build_indptr(major, size):
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(major, minlength=size), out=indptr[1:])
+    return indptr
+
+
+@instrument()
+def build_rating_matrix(ratings_filepath, output_dir, chunksize=1000000):
+    """
+    从评分数据构建稀疏矩阵并写入 output_dir。
+
+    参数：
+    - ratings_filepath: str
+        评分数据（userId, movieId, rating, ...），通常是 id_align 对齐后的 ratings_aligned.csv。
+    - output_dir: str
+        矩阵文件的输出目录。
+    - chunksize: int, 可选
+        读取 csv 时每块的行数。
+
+    同一用户对同一电影有多条评分时，保留文件中最后一条。
+    返回矩阵的形状和非零元个数。
+    """
+    user_ids, movie_ids, ratings = read_triples(ratings_filepath, chunksize)
+    total = len(ratings)
+
+    # 把 id 编码为连续的行号和列号
+    users, rows = np.unique(user_ids, return_inverse=True)
+    movies, cols = np.unique(movie_ids, return_inverse=True)
+    rows = rows.astype(np.int32)
+    cols = cols.astype(np.int32)
+    del user_ids, movie_ids
+
+    # 按 (行, 列) 排序，lexsort 是稳定排序，重复的 (行, 列) 保留文件中最后一条
+    order = np.lexsort((cols, rows))
+    rows, cols, ratings = rows[order], cols[order], ratings[order]
+    keep = np.ones(len(rows), dtype=bool)
+    keep[:-1] = (rows[:-1] != rows[1:]) | (cols[:-1] != cols[1:])
+    rows, cols, ratings = rows[keep], cols[keep], ratings[keep]
+
+    arrays = {
+        'user_ids': users.astype(np.int32),
+        'movie_ids': movies.astype(np.int32),
+        'csr_indptr': build_indptr(rows, len(users)),
+        'csr_indices': cols,
+        'csr_data': ratings.astype(np.float32),
+    }
+    # CSC：按 (列, 行) 排序；数据已按行排好，稳定排序后每列内的行号仍是升序
+    order = np.argsort(cols, kind='stable')
+    arrays['csc_indptr'] = build_indptr(cols, len(movies))
+    arrays['csc_indices'] = rows[order]
+    arrays['csc_data'] = arrays['csr_data'][order]
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(os.path.join(output_dir, f"{name}.npy"), values)
+    info = {'shape': [len(users), len(movies)], 'nnz': int(len(ratings))}
+    with open(os.path.join(output_dir, 'matrix.json'), 'w', encoding='utf-8') as file:
+        json.dump(info, file)
+
+    set_rows(rows_in=total, rows_out=len(ratings))
+    print(f"Rating matrix: {len(users)} users x {len(movies)} movies, {len(ratings)} ratings -> {output_dir}")
+    return info
+
+
+class RatingMatrix:
+    """
+    加载 build_rating_matrix 输出的矩阵，所有数组都以只读内存映射的方式打开。
+
+    用法：
+        matrix = RatingMatrix('./rating_matrix')
+        movie_ids, ratings = matrix.user_ratings(1)
+        user_ids, ratings = matrix.movie_ratings(862)
+        matrix.rating(1, 862)
+    返回的评分数组是内存映射文件的切片，不复制数据。
+    """
+
+    def __init__(self, matrix_dir):
+        self.matrix_dir = matrix_dir
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(matrix_dir, f"{name}.npy"), mmap_mode='r'))
+        self.shape = (len(self.user_ids), len(self.movie_ids))
+        self.nnz = len(self.csr_data)
+
+    # 在升序的 id 数组中查找下标，不存在时返回 -1
+    @staticmethod
+    def position(ids, value):
+        index = int(np.searchsorted(ids, value))
+        return index if index < len(ids) and ids[index] == value else -1
+
+    def user_index(self, user_id):
+        return self.position(self.user_ids, user_id)
+
+    def movie_index(self, movie_id):
+        return self.position(self.movie_ids, movie_id)
+
+    # 某个用户评过分的电影id（升序）和对应的评分；用户不存在时返回两个空数组
+    def user_ratings(self, user_id):
+        row = self.user_index(user_id)
+        if row < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, end = self.csr_indptr[row], self.csr_indptr[row + 1]
+        return self.movie_ids[self.csr_indices[start:end]], self.csr_data[start:end]
+
+    # 给某部电影评过分的用户id（升序）和对应的评分；电影不存在时返回两个空数组
+    def movie_ratings(self, movie_id):
+        col = self.movie_index(movie_id)
+        if col < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, end = self.csc_indptr[col], self.csc_indptr[col + 1]
+        return self.user_ids[self.csc_indices[start:end]], self.csc_data[start:end]
+
+    # 某个用户对某部电影的评分，没有评分时返回 nan
+    def rating(self, user_id, movie_id):
+        row = self.user_index(user_id)
+        col = self.movie_index(movie_id)
+        if row < 0 or col < 0:
+            return float('nan')
+        start, end = self.csr_indptr[row], self.csr_indptr[row + 1]
+        index = self.position(self.csr_indices[start:end], col)
+        return float(self.csr_data[start + index]) if index >= 0 else float('nan')
+
+    # 转换为 scipy.sparse 矩阵（需要安装 scipy），数组仍然是内存映射
+    def to_scipy(self, layout='csr'):
+        if sparse is None:
+            raise ImportError("scipy is required to convert the rating matrix")
+        if layout == 'csr':
+            return sparse.csr_matrix((self.csr_data, self.csr_indices, self.csr_indptr), shape=self.shape)
+        if layout == 'csc':
+            return sparse.csc_matrix((self.csc_data, self.csc_indices, self.csc_indptr), shape=self.shape)
+        raise ValueError(f"Unsupported layout: {layout}")
+
+
+if __name__ == "__main__":
+    # 在 id_align 之后运行
+    build_rating_matrix("./ratings_aligned.csv", "./rating_matrix")
+    matrix = RatingMatrix("./rating_matrix")
+    print(matrix.shape, matrix.nnz)
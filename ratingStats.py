@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from dataProcessing import RATINGS_DTYPES
+from instrumentation import instrument, set_rows
+from tableIO import write_table
+
+# 评分数据的统计：分块读取 ratings.csv，按电影和用户累加评分次数、总和、平方和、最早和最晚评分时间，
+# 以及每部电影每年的评分次数。累加器是以 id 为下标的 numpy 数组，每块用 bincount 和 ufunc.at 一次完成累加，
+# 内存占用只取决于最大的 id，与评分数量无关。
+
+# timestamp 是 int32 秒数，年份在 1970 到 2038 之间
+FIRST_YEAR = 1970
+LAST_YEAR = 2038
+
+
+class RatingAccumulator:
+    """
+    以 id 为下标的评分统计累加器。
+
+    参数：
+    - yearly: bool, 可选
+        是否按年统计评分次数。
+    """
+
+    def __init__(self, yearly=False):
+        self.yearly = yearly
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.float64)
+        self.squares = np.zeros(0, dtype=np.float64)
+        self.first = np.zeros(0, dtype=np.int64)
+        self.last = np.zeros(0, dtype=np.int64)
+        self.years = np.zeros((0, LAST_YEAR - FIRST_YEAR + 1), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.count)
+
+    # 扩大数组使下标 size - 1 可用，按2倍扩容避免频繁复制
+    def grow(self, size):
+        if size <= len(self.count):
+            return
+        size = max(size, len(self.count) * 2)
+        extra = size - len(self.count)
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(extra, dtype=np.float64)])
+        self.squares = np.concatenate([self.squares, np.zeros(extra, dtype=np.float64)])
+        self.first = np.concatenate([self.first, np.full(extra, np.iinfo(np.int64).max)])
+        self.last = np.concatenate([self.last, np.full(extra, np.iinfo(np.int64).min)])
+        if self.yearly:
+            self.years = np.concatenate([self.years, np.zeros((extra, self.years.shape[1]), dtype=np.int32)])
+
+    def add(self, ids, ratings, timestamps):
+        ids = ids.astype(np.int64)
+        if len(ids) == 0:
+            return
+        size = int(ids.max()) + 1
+        self.grow(size)
+        ratings = ratings.astype(np.float64)
+        self.count[:size] += np.bincount(ids, minlength=size)
+        self.total[:size] += np.bincount(ids, weights=ratings, minlength=size)
+        self.squares[:size] += np.bincount(ids, weights=ratings * ratings, minlength=size)
+        np.minimum.at(self.first, ids, timestamps)
+        np.maximum.at(self.last, ids, timestamps)
+        if self.yearly:
+            years = timestamps.astype('datetime64[s]').astype('datetime64[Y]').astype(np.int64) + 1970 - FIRST_YEAR
+            years = np.clip(years, 0, self.years.shape[1] - 1)
+            np.add.at(self.years, (ids, years), 1)
+
+    def to_frame(self, id_column):
+        """
+        转换为 DataFrame，只包含有评分的 id。
+        rating_var 为样本方差，只有一条评分时为空值；first_rated/last_rated 为 unix 时间戳；
+        yearly 为 True 时每个有评分的年份一列 ratings_<年份>。
+        """
+        ids = np.flatnonzero(self.count)
+        count = self.count[ids]
+        mean = self.total[ids] / count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (self.squares[ids] - count * mean * mean) / (count - 1)
+        var = np.where(count > 1, np.maximum(var, 0), np.nan)
+
+        frame = pd.DataFrame({
+            id_column: ids.astype(np.int32),
+            'rating_count': count.astype(np.int32),
+            'rating_mean': mean.astype(np.float32),
+            'rating_var': var.astype(np.float32),
+            'first_rated': self.first[ids].astype(np.int32),
+            'last_rated': self.last[ids].astype(np.int32),
+        })
+        if self.yearly:
+            years = self.years[ids]
+            for column in np.flatnonzero(years.sum(axis=0)):
+                frame[f"ratings_{FIRST_YEAR + column}"] = years[:, column]
+        return frame
+
+
+@instrument()
+def aggregate_ratings(ratings_filepath, movie_output_filepath="./movie_ratings.csv",
+                      user_output_filepath="./user_ratings.csv", chunksize=1000000):
+    """
+    分块统计评分数据，写出电影和用户两张统计表，格式由扩展名决定（csv、parquet、arrow）。
+
+    参数：
+    - ratings_filepath: str
+        评分数据（userId, movieId, rating, timestamp），通常是 id_align 对齐后的 ratings_aligned.csv。
+    - movie_output_filepath: str, 可选
+        电影统计表，id 列与 movies.csv 的 id 对应，包含每年的评分次数。
+    - user_output_filepath: str, 可选
+        用户统计表，以 userId 为键；为 None 时不统计用户。
+    - chunksize: int, 可选
+        每次读取的行数。
+
+    返回 (电影统计表, 用户统计表)。
+    """
+    movies = RatingAccumulator(yearly=True)
+    users = RatingAccumulator() if user_output_filepath else None
+
+    rows = 0
+    for ratings in pd.read_csv(ratings_filepath, dtype=RATINGS_DTYPES, chunksize=chunksize):
+        # 负数 id 无法作为下标，跳过
+        ratings = ratings[(ratings['movieId'] >= 0) & (ratings['userId'] >= 0)]
+        timestamps = ratings['timestamp'].to_numpy().astype(np.int64)
+        rating_values = ratings['rating'].to_numpy()
+        movies.add(ratings['movieId'].to_numpy(), rating_values, timestamps)
+        if users is not None:
+            users.add(ratings['userId'].to_numpy(), rating_values, timestamps)
+        rows += len(ratings)
+
+    movie_stats = movies.to_frame('id')
+    write_table(movie_stats, movie_output_filepath)
+    user_stats = None
+    if users is not None:
+        user_stats = users.to_frame('userId')
+        write_table(user_stats, user_output_filepath)
+
+    set_rows(rows_in=rows, rows_out=len(movie_stats))
+    print(f"{ratings_filepath}: {rows} ratings, {len(movie_stats)} movies"
+          + (f", {len(user_stats)} users" if user_stats is not None else ""))
+    return movie_stats, user_stats
+
+
+if __name__ == "__main__":
+    # 在 id_align 之后运行，统计结果按 id 与 movies.csv 连接
+    aggregate_ratings("./ratings_aligned.csv", "./movie_ratings.csv", "./user_ratings.csv")
@@ -0,0 +1,107 @@
+import json
+import sqlite3
+import threading
+import time
+
+# TMDB 接口响应的本地缓存，保存在 SQLite 文件中，以 (电影id, 语言) 为键
+# 超过 ttl 的记录视为过期，需要重新请求；记录数超过 max_entries 时删除最久未使用的记录
+
+
+class ResponseCache:
+    """
+    参数：
+    - filepath: str
+        SQLite 数据库文件路径。
+    - ttl: float, 可选
+        记录的有效期（秒），默认30天。
+    - max_entries: int, 可选
+        最多保存的记录数，超过时删除最久未使用的记录。
+    """
+
+    def __init__(self, filepath, ttl=30 * 24 * 3600, max_entries=200000):
+        self.filepath = filepath
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        # 多个线程共用一个连接，由 self.lock 保证串行访问
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " movie_id TEXT NOT NULL,"
+            " language TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (movie_id, language))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    # 返回未过期的缓存数据，没有或已过期时返回 None
+    def get(self, movie_id, language):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data, fetched_at FROM responses WHERE movie_id = ? AND language = ?",
+                (str(movie_id), language),
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE movie_id = ? AND language = ?",
+                (now, str(movie_id), language),
+            )
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, movie_id, language, data):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (movie_id, language, data, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (str(movie_id), language, json.dumps(data, ensure_ascii=False), now, now),
+            )
+            # size 是估计值（替换已有记录时也会加1），超过上限时才重新统计并淘汰
+            self.size += 1
+            if self.size > self.max_entries:
+                self.evict()
+            self.connection.commit()
+
+    # 删除最久未使用的记录，使记录数降到上限的90%
+    def evict(self):
+        self.size = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = self.size - int(self.max_entries * 0.9)
+        if excess > 0 and self.size > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM responses WHERE rowid IN "
+                "(SELECT rowid FROM responses ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            self.size -= excess
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': self.size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,216 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from instrumentation import instrument, set_rows
+from invertedIndex import explode_column
+from tableIO import read_table
+
+# 基于内容的相似电影：用类型、关键词、演员、导演构建稀疏特征矩阵，计算每部电影最相似的 k 部电影
+#
+# 每个字段单独做 TF-IDF（每部电影每个取值计1次，idf = log(N / df)），按行做 L2 归一化后乘以字段权重，
+# 再把所有字段横向拼接并整体归一化，两部电影特征向量的点积即余弦相似度。
+# 相似度按批计算：每批取若干行与整个矩阵相乘，得到的稠密块用 argpartition 取 top-k，内存只取决于批大小。
+#
+# 结果保存为三个文件：
+# - neighbors.npy：int32，形状 (电影数, k)，每行是最相似的电影id，按相似度降序，不足 k 个时用 -1 补齐
+# - scores.npy：float32，对应的相似度
+# - positions.npy：int32，下标为电影id，值为该电影在 neighbors 中的行号，不存在为 -1，查询时 O(1) 定位
+
+# 字段默认权重
+FIELD_WEIGHTS = {'genres': 1.0, 'keywords': 1.0, 'actor': 1.0, 'director': 1.0}
+
+# 每部电影只使用排名前几位的演员
+ACTOR_LIMIT = 5
+
+# 工作进程中的特征矩阵，由 init_worker 设置
+features = None
+features_t = None
+
+
+# 把 (行号, 取值) 对编码为 TF-IDF 矩阵，每行 L2 归一化
+def tfidf_matrix(rows, values, n_rows):
+    pairs = pd.DataFrame({'row': rows, 'value': values}).dropna()
+    pairs = pairs[pairs['value'].astype(str) != ''].drop_duplicates()
+    codes, terms = pd.factorize(pairs['value'])
+    matrix = sparse.csr_matrix((np.ones(len(codes), dtype=np.float32), (pairs['row'].to_numpy(), codes)),
+                               shape=(n_rows, len(terms)))
+
+    df = np.bincount(codes, minlength=len(terms))
+    matrix = matrix @ sparse.diags(np.log(n_rows / np.maximum(df, 1)).astype(np.float32))
+    return normalize_rows(matrix)
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags((1 / norms).astype(np.float32)) @ matrix)
+
+
+def build_features(movies, keywords=None, weights=None, actor_limit=ACTOR_LIMIT):
+    """
+    构建特征矩阵。
+
+    参数：
+    - movies: DataFrame
+        处理后的 movies 数据，包含 id 以及 genres、director、actor 等用'|'分隔的字段。
+    - keywords: DataFrame, 可选
+        handle_keywords 输出的关键词数据（movieId, userId, tag）。
+    - weights: dict, 可选
+        字段名 -> 权重，默认为 FIELD_WEIGHTS；权重为0的字段不参与计算。
+    - actor_limit: int, 可选
+        每部电影使用的演员数。
+
+    返回 (电影id数组, 行归一化的 csr 特征矩阵)，第 i 行对应第 i 个电影id。
+    """
+    weights = FIELD_WEIGHTS if weights is None else weights
+    movie_ids = pd.to_numeric(movies['id'], errors='coerce')
+    movies = movies[movie_ids.notna()].drop_duplicates(subset=['id'])
+    movie_ids = pd.to_numeric(movies['id']).astype(np.int32).to_numpy()
+    positions = pd.Series(np.arange(len(movie_ids)), index=movie_ids)
+
+    blocks = []
+    for field, weight in weights.items():
+        if not weight:
+            continue
+        if field == 'keywords':
+            if keywords is None:
+                continue
+            keyword_ids = pd.to_numeric(keywords['movieId'], errors='coerce')
+            rows = positions.reindex(keyword_ids.to_numpy()).to_numpy()
+            values = keywords['tag'].to_numpy()
+        elif field in movies.columns:
+            exploded = pd.DataFrame({'id': np.arange(len(movies)), field: movies[field].to_numpy()})
+            rows, values = explode_column(exploded, field)
+            if field == 'actor' and actor_limit:
+                # explode 保持原顺序，每部电影内的序号即演员的排名
+                rank = rows.groupby(level=0).cumcount()
+                rows, values = rows[rank < actor_limit], values[rank < actor_limit]
+            rows, values = rows.to_numpy(), values.to_numpy()
+        else:
+            continue
+        valid = ~pd.isna(rows)
+        blocks.append(tfidf_matrix(rows[valid].astype(np.int64), values[valid], len(movie_ids)) * weight)
+
+    if not blocks:
+        raise ValueError("No feature columns found")
+    return movie_ids, normalize_rows(sparse.hstack(blocks, format='csr'))
+
+
+def init_worker(matrix):
+    global features, features_t
+    features = matrix
+    features_t = matrix.T.tocsc()
+
+
+# 计算第 start 到 end 行的 top-k，返回行内按相似度降序的列号和相似度
+def top_k_batch(start, end, k):
+    scores = (features[start:end] @ features_t).toarray()
+    # 排除自身
+    scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+    k = min(k, scores.shape[1] - 1)
+    if k <= 0:
+        return np.empty((end - start, 0), dtype=np.int32), np.empty((end - start, 0), dtype=np.float32)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1).astype(np.int32), \
+        np.take_along_axis(top_scores, order, axis=1).astype(np.float32)
+
+
+@instrument()
+def build_neighbors(movies_filepath, output_dir, keywords_filepath=None, k=20, batch_size=512, workers=1,
+                    weights=None, actor_limit=ACTOR_LIMIT):
+    """
+    计算每部电影最相似的 k 部电影，写入 output_dir。
+
+    参数：
+    - movies_filepath: str
+        处理后的 movies 文件（csv、parquet 或 arrow）。
+    - output_dir: str
+        结果的输出目录。
+    - keywords_filepath: str, 可选
+        handle_keywords 输出的关键词文件。
+    - k: int, 可选
+        每部电影保留的相似电影数。
+    - batch_size: int, 可选
+        每批计算的行数，每批需要 batch_size * 电影数 * 8 字节的内存。
+    - workers: int, 可选
+        并行计算的进程数。
+    - weights, actor_limit:
+        见 build_features。
+
+    相似度为0的电影不算作相似电影。返回电影数和 k。
+    """
+    movies = read_table(movies_filepath, columns=['id', 'genres', 'director', 'actor'], dtype=str)
+    keywords = read_table(keywords_filepath, dtype={'tag': str}) if keywords_filepath else None
+    movie_ids, matrix = build_features(movies, keywords, weights, actor_limit)
+    n = len(movie_ids)
+
+    bounds = list(range(0, n, batch_size)) + [n]
+    batches = list(zip(bounds[:-1], bounds[1:]))
+    if workers <= 1:
+        init_worker(matrix)
+        results = [top_k_batch(start, end, k) for start, end in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(matrix,)) as executor:
+            results = list(executor.map(top_k_batch, *zip(*batches), [k] * len(batches)))
+
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if results:
+        columns = np.concatenate([result[0] for result in results])
+        values = np.concatenate([result[1] for result in results])
+        found = values > 0
+        width = columns.shape[1]
+        neighbors[:, :width] = np.where(found, movie_ids[columns], -1)
+        scores[:, :width] = np.where(found, values, 0)
+
+    positions = np.full(int(movie_ids.max()) + 1 if n else 0, -1, dtype=np.int32)
+    positions[movie_ids] = np.arange(n, dtype=np.int32)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'neighbors.npy'), neighbors)
+    np.save(os.path.join(output_dir, 'scores.npy'), scores)
+    np.save(os.path.join(output_dir, 'positions.npy'), positions)
+    info = {'movies': n, 'k': k, 'features': matrix.shape[1]}
+    with open(os.path.join(output_dir, 'neighbors.json'), 'w', encoding='utf-8') as file:
+        json.dump(info, file)
+
+    set_rows(rows_in=n, rows_out=n)
+    print(f"Neighbors: {n} movies, {matrix.shape[1]} features, top {k} -> {output_dir}")
+    return info
+
+
+class SimilarMovies:
+    """
+    加载 build_neighbors 输出的相似电影表，以内存映射方式打开。
+
+    用法：
+        similar = SimilarMovies('./similar_movies')
+        movie_ids, scores = similar.lookup(862, k=10)
+    """
+
+    def __init__(self, neighbors_dir):
+        self.neighbors = np.load(os.path.join(neighbors_dir, 'neighbors.npy'), mmap_mode='r')
+        self.scores = np.load(os.path.join(neighbors_dir, 'scores.npy'), mmap_mode='r')
+        self.positions = np.load(os.path.join(neighbors_dir, 'positions.npy'), mmap_mode='r')
+
+    # 某部电影最相似的电影id和相似度（降序），电影不存在时返回两个空数组
+    def lookup(self, movie_id, k=None):
+        row = self.positions[movie_id] if 0 <= movie_id < len(self.positions) else -1
+        if row < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        neighbors = self.neighbors[row, :k]
+        count = int(np.count_nonzero(neighbors >= 0))
+        return neighbors[:count], self.scores[row, :count]
+
+
+if __name__ == "__main__":
+    # 在 data_processing 和 handle_keywords 之后运行
+    build_neighbors("./movies.csv", "./similar_movies", keywords_filepath="./keywords.csv", k=20,
+                    workers=os.cpu_count())
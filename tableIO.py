@@ -0,0 +1,200 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # 只读写 csv 时不需要 pyarrow
+    pa = None
+
+# 读写数据集的统一入口：根据文件扩展名选择 csv、parquet 或 arrow(IPC/feather) 格式
+# parquet 和 arrow 是列式存储，只读取部分列时不需要解析整个文件，arrow 文件还可以内存映射读取
+
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+# 根据扩展名判断文件格式，未知扩展名按 csv 处理
+def format_of(filepath):
+    return FORMATS.get(os.path.splitext(filepath)[1].lower(), 'csv')
+
+
+# 把文件路径的扩展名替换为指定格式的扩展名，fmt 为 None 时原样返回
+def with_format(filepath, fmt):
+    if fmt is None:
+        return filepath
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unsupported output format: {fmt}")
+    return os.path.splitext(filepath)[0] + EXTENSIONS[fmt]
+
+
+def require_pyarrow(filepath):
+    if pa is None:
+        raise ImportError(f"pyarrow is required to read or write '{filepath}'")
+
+
+# 判断是否为字符串列（旧版 pandas 为 object，新版 pandas 默认为 str）
+def is_text(series):
+    return series.dtype == object or isinstance(series.dtype, pd.StringDtype)
+
+
+# 非空值都能转换为数字的字符串列（例如按字符串读取的 budget、id），这类列不做字典编码
+def looks_numeric(series):
+    values = series.dropna()
+    return len(values) > 0 and pd.to_numeric(values, errors='coerce').notna().all()
+
+
+# 需要字典编码的列：分类列，以及重复值较多（不同值不超过行数的 max_ratio）且不是数字的字符串列
+def dictionary_columns(df, max_ratio=0.5):
+    columns = []
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            columns.append(column)
+        elif is_text(series) and series.notna().any() and not looks_numeric(series) \
+                and series.nunique() <= max_ratio * len(df):
+            columns.append(column)
+    return columns
+
+
+def write_table(df, filepath, **csv_kwargs):
+    """
+    将 DataFrame 写入文件，格式由扩展名决定。
+
+    参数：
+    - df: DataFrame
+        要写入的数据。
+    - filepath: str
+        输出文件路径，.csv / .parquet / .arrow(.feather)。
+    - csv_kwargs:
+        写 csv 时传给 DataFrame.to_csv 的额外参数。
+    """
+    fmt = format_of(filepath)
+    if fmt == 'csv':
+        df.to_csv(filepath, index=False, **csv_kwargs)
+        return
+
+    # parquet/arrow 与分块写入使用同一套列类型和字典编码
+    with ChunkWriter(filepath) as writer:
+        writer.write(df)
+
+
+def read_table(filepath, columns=None, **csv_kwargs):
+    """
+    读取 write_table 写出的文件，columns 指定时只读取这些列。
+    arrow 文件不压缩并使用内存映射，只读取少数几列时几乎不需要时间。
+    csv_kwargs 只在读取 csv 时传给 pd.read_csv，其他格式忽略。
+    """
+    fmt = format_of(filepath)
+    if fmt == 'csv':
+        return pd.read_csv(filepath, usecols=columns, **csv_kwargs)
+
+    require_pyarrow(filepath)
+    if fmt == 'parquet':
+        table = pq.read_table(filepath, columns=columns, memory_map=True)
+    else:
+        table = feather.read_table(filepath, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+class ChunkWriter:
+    """
+    分块追加写入同一个文件，用于分块处理流程。
+
+    csv 直接追加；parquet 每块写成一个 row group；arrow 每块写成一个 record batch。
+    列类型由第一块决定，所有块使用同一个 schema：
+    - dictionary_columns 中的列（默认由第一块按 dictionary_columns() 选出，第一块全为空值的列除外）
+      为 dictionary<int32, string>，
+      每列的字典跨块累加，后续块只追加新出现的值，arrow 文件中写为字典增量
+    - 其余字符串列和分类列为 string，避免某一块全为空值时被推断成 null 或其他类型
+    - 其他列使用第一块推断出的类型，后续块转换为该类型
+    """
+
+    def __init__(self, filepath, columns=None, dictionary_columns=None, **csv_kwargs):
+        self.filepath = filepath
+        self.format = format_of(filepath)
+        self.columns = columns
+        self.dictionary_columns = dictionary_columns
+        self.csv_kwargs = csv_kwargs
+        self.writer = None
+        self.schema = None
+        self.dictionaries = {}
+        self.started = False
+        self.closed = False
+        self.rows = 0
+        if self.format != 'csv':
+            require_pyarrow(filepath)
+
+    # 根据第一块确定 schema，保留 pandas 元数据，读回时可空整数等类型不变
+    def build_schema(self, df):
+        if self.dictionary_columns is None:
+            self.dictionary_columns = dictionary_columns(df)
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        for position, field in enumerate(schema):
+            # 第一块全为空值的列字典为空，arrow 文件不允许之后再替换字典，这类列不做字典编码
+            if field.name in self.dictionary_columns and df[field.name].notna().any():
+                schema = schema.set(position, pa.field(field.name, pa.dictionary(pa.int32(), pa.string())))
+                self.dictionaries[field.name] = pd.Index([], dtype=object)
+            elif is_text(df[field.name]) or isinstance(df[field.name].dtype, pd.CategoricalDtype):
+                # 全为空值的分类列没有类别，推断出的字典值类型不一定是字符串
+                schema = schema.set(position, pa.field(field.name, pa.string()))
+        return schema
+
+    # 用跨块累加的字典编码一列，新出现的值追加到字典末尾
+    def encode(self, name, series):
+        present = series.notna().to_numpy()
+        values = series[present].astype(str)
+        dictionary = self.dictionaries[name]
+        dictionary = self.dictionaries[name] = dictionary.append(
+            pd.Index(values.unique()).difference(dictionary, sort=False))
+        indices = np.full(len(series), -1, dtype=np.int32)
+        indices[present] = dictionary.get_indexer(values)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, mask=~present),
+                                              pa.array(dictionary.to_numpy(dtype=object), type=pa.string()))
+
+    def to_table(self, df):
+        arrays = []
+        for field in self.schema:
+            series = df[field.name]
+            if field.name in self.dictionaries:
+                arrays.append(self.encode(field.name, series))
+            elif pa.types.is_string(field.type):
+                arrays.append(pa.array(series.astype('string'), type=pa.string(), from_pandas=True))
+            else:
+                arrays.append(pa.Array.from_pandas(series).cast(field.type))
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def write(self, df):
+        if self.format == 'csv':
+            df.to_csv(self.filepath, index=False, mode='a' if self.started else 'w', header=not self.started,
+                      **self.csv_kwargs)
+        else:
+            if self.writer is None:
+                self.schema = self.build_schema(df)
+                if self.format == 'parquet':
+                    self.writer = pq.ParquetWriter(self.filepath, self.schema)
+                else:
+                    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                    self.writer = pa.ipc.new_file(self.filepath, self.schema, options=options)
+            self.writer.write_table(self.to_table(df))
+        self.started = True
+        self.rows += len(df)
+
+    # 关闭文件；一块数据都没有写入时，写出只有表头（或空表）的文件
+    def close(self):
+        if self.closed:
+            return
+        if not self.started:
+            write_table(pd.DataFrame(columns=self.columns or []), self.filepath, **self.csv_kwargs)
+        elif self.writer is not None:
+            self.writer.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
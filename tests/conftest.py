@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+# 模块都在仓库根目录下，测试时从根目录导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubServer:
+    """
+    本地模拟服务器：按路径返回预先设置的响应，设置了 ETag 的响应支持 If-None-Match/304。
+    响应头中指定比响应体更大的 Content-Length（同时设置 Connection: close）可以模拟下载中途连接中断。
+    用 route_sequence 设置的路径依次返回每个响应，最后一个响应重复返回。
+    requests 记录每个请求的 (路径, 请求头)。
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                with stub.lock:
+                    stub.requests.append((path, dict(self.headers)))
+                    responses = stub.routes.get(path, [(404, {}, b'{}')])
+                    status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+                if headers.get('ETag') and self.headers.get('If-None-Match') == headers['ETag']:
+                    status, body = 304, b''
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if 'Content-Length' not in headers:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def route(self, path, body=b'', status=200, headers=None):
+        self.route_sequence(path, [(status, headers, body)])
+
+    # responses 为 (状态码, 响应头, 响应体) 的列表
+    def route_sequence(self, path, responses):
+        with self.lock:
+            self.routes[path] = [(status, headers or {}, body) for status, headers, body in responses]
+
+    def paths(self):
+        with self.lock:
+            return [path for path, _ in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
@@ -0,0 +1,110 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import API_poster_path
+import instrumentation
+from API_poster_path import fetch_movie_data, get_json_data
+from tableIO import read_table
+from tmdbClient import TMDBClient
+
+
+def movie_body(movie_id):
+    return json.dumps({'id': movie_id, 'poster_path': f"/{movie_id}.jpg", 'title': f"Movie {movie_id}",
+                       'genres': [{'id': 18, 'name': 'Drama'}]}).encode()
+
+
+def serve_movies(server, movie_ids):
+    for movie_id in movie_ids:
+        server.route(f"/movie/{movie_id}", movie_body(movie_id), headers={'Content-Type': 'application/json'})
+
+
+def fetch(server, movie_ids, output_filepath, **kwargs):
+    client = TMDBClient('key', base_url=server.url, concurrency=4, rate=1000, max_retries=0, backoff=0, timeout=5)
+    try:
+        return get_json_data(movie_ids, output_filepath, client, batch_size=2, **kwargs)
+    finally:
+        client.close()
+
+
+def read_lines(filepath):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_get_json_data_resumes_after_crash(stub_server, tmp_path):
+    serve_movies(stub_server, range(1, 11))
+    output_filepath = str(tmp_path / 'extra_data.csv')
+    checkpoint_filepath = str(tmp_path / 'extra_data.checkpoint')
+    movie_ids = [str(movie_id) for movie_id in range(1, 11)]
+
+    # 第一次运行只完成前5个id，随后在写入 checkpoint 时中断，留下半行
+    fetch(stub_server, movie_ids[:5], output_filepath, checkpoint_file=checkpoint_filepath)
+    with open(checkpoint_filepath, 'a', encoding='utf-8') as file:
+        file.write('{"id": "6", "da')
+    stub_server.requests.clear()
+
+    summary = fetch(stub_server, movie_ids, output_filepath, checkpoint_file=checkpoint_filepath)
+
+    assert sorted(stub_server.paths()) == sorted(f"/movie/{movie_id}" for movie_id in movie_ids[5:])
+    assert summary['written'] == 5 and summary['skipped'] == 5 and summary['errors'] == 0
+    output = pd.read_csv(output_filepath, dtype=str)
+    assert sorted(output['id'], key=int) == movie_ids
+    assert sorted((entry['id'] for entry in read_lines(checkpoint_filepath)), key=int) == movie_ids
+
+
+def test_columnar_output_does_not_touch_csv_with_same_stem(stub_server, tmp_path):
+    pytest.importorskip('pyarrow')
+    serve_movies(stub_server, range(1, 7))
+    csv_filepath = tmp_path / 'extra_data.csv'
+    csv_filepath.write_text('keep me\n', encoding='utf-8')
+    output_filepath = str(tmp_path / 'extra_data.parquet')
+
+    fetch(stub_server, ['1', '2', '3'], output_filepath)
+    assert not os.path.exists(f"{output_filepath}.partial")
+    stub_server.requests.clear()
+    # 再次运行时以已有的输出为起点，只请求新的id
+    summary = fetch(stub_server, ['1', '2', '3', '4', '5', '6'], output_filepath)
+
+    assert csv_filepath.read_text(encoding='utf-8') == 'keep me\n'
+    assert sorted(stub_server.paths()) == ['/movie/4', '/movie/5', '/movie/6']
+    assert summary['skipped'] == 3
+    assert sorted(read_table(output_filepath)['id'].astype(str), key=int) == ['1', '2', '3', '4', '5', '6']
+
+
+def test_fetch_errors_are_logged_and_reported(stub_server, tmp_path, capsys):
+    serve_movies(stub_server, [1, 3])
+    # 返回无法解析的 json，不是 HTTPError
+    stub_server.route('/movie/2', b'not json', headers={'Content-Type': 'application/json'})
+    log_filepath = str(tmp_path / 'metrics.jsonl')
+    instrumentation.enable(log_filepath)
+    try:
+        summary = fetch(stub_server, ['1', '2', '3'], str(tmp_path / 'extra_data.csv'))
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    assert summary['errors'] == 1 and summary['written'] == 2
+    output = capsys.readouterr().out
+    assert 'movie data for ID 2' in output
+    assert '3/3 movies' in output and 'errors 1 (33.3%)' in output
+    errors = [entry for entry in read_lines(log_filepath) if entry['event'] == 'error']
+    assert len(errors) == 1 and errors[0]['stage'] == 'get_json_data'
+
+
+def test_default_client_uses_response_cache(stub_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(API_poster_path, 'default_client', None)
+    client = API_poster_path.get_default_client(str(tmp_path / 'cache.sqlite'))
+    try:
+        client.base_url = stub_server.url
+        serve_movies(stub_server, [1])
+        assert fetch_movie_data(1)['title'] == 'Movie 1'
+        assert fetch_movie_data(1)['title'] == 'Movie 1'
+        # 第二次从缓存读取，不再请求
+        assert stub_server.paths() == ['/movie/1']
+        assert client.cache.stats()['hits'] == 1
+    finally:
+        client.close()
+        client.cache.close()
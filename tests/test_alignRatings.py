@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+import dataProcessing
+from dataProcessing import align_ratings_chunked
+
+
+def test_align_ratings_reports_peak_growth_of_the_call(tmp_path, monkeypatch):
+    ratings_filepath = str(tmp_path / 'ratings.csv')
+    pd.DataFrame({'userId': [1, 1, 2, 2], 'movieId': [10, 11, 10, 99], 'rating': [4.0, 3.5, 5.0, 1.0],
+                  'timestamp': [1, 2, 3, 4]}).to_csv(ratings_filepath, index=False)
+    # 调用之前进程峰值已经是 500 MB（例如之前对齐过更大的文件），调用期间升到 520 MB
+    peaks = iter([500.0, 520.0])
+    monkeypatch.setattr(dataProcessing, 'peak_rss_mb', lambda: next(peaks))
+
+    output_filepath = str(tmp_path / 'ratings_aligned.csv')
+    stats = align_ratings_chunked(np.array([10, 11]), ratings_filepath, output_filepath, chunksize=2)
+
+    assert stats['kept'] == 3 and stats['dropped'] == 1
+    assert stats['peak_growth_mb'] == 20.0 and 'peak_mb' not in stats
+    assert pd.read_csv(output_filepath)['movieId'].tolist() == [10, 11, 10]
@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+import pytest
+
+from benchmark import write_dataset
+from dataProcessing import run_incremental, run_pipeline
+from tableIO import read_table
+
+OUTPUTS = ('movies', 'poster_path', 'quarantine')
+
+
+def output_paths(output_dir, fmt):
+    os.makedirs(output_dir, exist_ok=True)
+    return [os.path.join(output_dir, f"{name}.{fmt}") for name in OUTPUTS]
+
+
+def full_run(data_dir, output_dir, fmt):
+    movies, posters, quarantine = output_paths(output_dir, fmt)
+    run_pipeline(os.path.join(data_dir, 'movies_metadata.csv'), os.path.join(data_dir, 'credits.csv'),
+                 movies, posters, ratings_files=(), quarantine_filepath=quarantine)
+    return read_outputs(output_dir, fmt)
+
+
+def incremental_run(data_dir, output_dir, fmt):
+    movies, posters, quarantine = output_paths(output_dir, fmt)
+    summary = run_incremental(os.path.join(data_dir, 'movies_metadata.csv'), os.path.join(data_dir, 'credits.csv'),
+                              movies, posters, ratings_files=(), quarantine_filepath=quarantine)
+    return summary, read_outputs(output_dir, fmt)
+
+
+# csv 按字符串比较内容，parquet 同时比较列类型
+def read_outputs(output_dir, fmt):
+    return tuple(read_table(path, dtype=str) for path in output_paths(output_dir, fmt))
+
+
+def assert_same(left, right):
+    for left_frame, right_frame in zip(left, right):
+        pd.testing.assert_frame_equal(left_frame.reset_index(drop=True), right_frame.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_incremental_matches_full_run_on_malformed_input(tmp_path, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    data_dir = tmp_path / 'data'
+    write_dataset(str(data_dir), 600, ratings=0, duplicate_rate=0.02, malformed_rate=0.02)
+
+    full = full_run(data_dir, tmp_path / 'full', fmt)
+    summary, incremental = incremental_run(data_dir, tmp_path / 'incremental', fmt)
+    assert len(full[2]) > 0
+    assert not full[0]['id'].astype(str).str.contains('-').any()
+    assert summary['added'] == len(full[0])
+    assert_same(full, incremental)
+
+    # 修改一行、删除一行、把一行改成异常行后再次运行，只处理变化的部分，结果仍与完整运行一致
+    metadata_filepath = data_dir / 'movies_metadata.csv'
+    metadata = pd.read_csv(metadata_filepath, dtype=str)
+    valid = metadata.index[~metadata['id'].str.contains('-') & ~metadata['id'].duplicated(keep=False)]
+    metadata.loc[valid[0], 'title'] = 'Changed title'
+    metadata.loc[valid[2], 'budget'] = 'not a number'
+    metadata = metadata.drop(index=valid[1])
+    metadata.to_csv(metadata_filepath, index=False)
+    credits_filepath = data_dir / 'credits.csv'
+    pd.read_csv(credits_filepath, dtype=str).drop(index=valid[1]).to_csv(credits_filepath, index=False)
+
+    full = full_run(data_dir, tmp_path / 'full', fmt)
+    summary, incremental = incremental_run(data_dir, tmp_path / 'incremental', fmt)
+    assert summary == {'added': 0, 'changed': 1, 'removed': 2}
+    assert_same(full, incremental)
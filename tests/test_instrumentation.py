@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def metrics_log(tmp_path):
+    filepath = tmp_path / 'metrics.jsonl'
+    instrumentation.enable(str(filepath))
+    yield filepath
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_stage_memory_fields(metrics_log, monkeypatch):
+    # 进程内存峰值依次为：allocate 开始、allocate 结束、small 开始、small 结束
+    peaks = iter([100.0, 350.0, 350.0, 350.0])
+    monkeypatch.setattr(instrumentation, 'peak_rss_mb', lambda: next(peaks))
+    with instrumentation.stage('allocate'):
+        pass
+    with instrumentation.stage('small'):
+        pass
+
+    with open(metrics_log, 'r', encoding='utf-8') as file:
+        stages = {entry['name']: entry for entry in map(json.loads, file) if entry['event'] == 'stage'}
+    assert stages['allocate']['peak_growth_mb'] == 250.0
+    # 第二个阶段没有超过之前的峰值，增加量为0，进程峰值仍包含前一个阶段
+    assert stages['small']['peak_growth_mb'] == 0.0
+    assert stages['small']['process_peak_mb'] == 350.0
+    totals = instrumentation.snapshot()['stages']
+    assert 'peak_mb' not in totals['small']
+    assert totals['allocate']['peak_growth_mb'] == 250.0
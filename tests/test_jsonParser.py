@@ -0,0 +1,99 @@
+import ast
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from jsonParser import extract_values, iter_records, join_column, parse_column, parse_records
+
+CAST = ("[{'cast_id': 14, 'character': 'Woody (voice)', 'name': 'Tom Hanks', 'order': 0, 'profile_path': None}, "
+        "{'cast_id': 15, 'character': \"Buzz's Friend\", 'name': \"Tim O'Reilly\", 'order': 1, 'adult': True}, "
+        "{'cast_id': 16, 'character': 'Mr. {Potato}, Head', 'name': 'Don \\'D\\' Rickles', 'order': 2, "
+        "'popularity': 1.5e-3, 'gender': -1}]")
+
+CREW = ("[{'department': 'Directing', 'job': 'Director', 'name': 'John Lasseter'}, "
+        "{'department': 'Writing', 'job': 'Screenplay', 'name': 'Joss Whedon'}, "
+        "{'department': 'Directing', 'job': 'Director', 'name': 'Lee Unkrich'}]")
+
+
+@pytest.mark.parametrize('cell', [CAST, CREW, "[{'id': 16, 'name': 'Animation'}]", '[]'])
+def test_parse_records_matches_literal_eval(cell):
+    assert parse_records(cell) == ast.literal_eval(cell)
+
+
+def test_parse_records_values():
+    records = parse_records(CAST)
+    # 双引号中的撇号、单引号中的转义引号
+    assert [record['name'] for record in records] == ['Tom Hanks', "Tim O'Reilly", "Don 'D' Rickles"]
+    assert records[1]['character'] == "Buzz's Friend"
+    # 字符串中的 '{'、',' 不会被当作新字典或值的结束
+    assert len(records) == 3 and records[2]['character'] == 'Mr. {Potato}, Head'
+    # None/True 和数字
+    assert records[0]['profile_path'] is None and records[1]['adult'] is True
+    assert records[0]['cast_id'] == 14 and isinstance(records[0]['cast_id'], int)
+    assert records[2]['popularity'] == 1.5e-3 and records[2]['gender'] == -1
+
+
+def test_parse_records_fields():
+    assert parse_records(CAST, fields=['name', 'order']) == [
+        {'name': 'Tom Hanks', 'order': 0}, {'name': "Tim O'Reilly", 'order': 1},
+        {'name': "Don 'D' Rickles", 'order': 2}]
+
+
+@pytest.mark.parametrize('cell', [np.nan, None, 1.0])
+def test_non_string_cells(cell):
+    assert parse_records(cell) == []
+    assert extract_values(cell) == ''
+    assert list(iter_records(cell, ['name'])) == []
+
+
+def test_empty_list_cell():
+    assert parse_records('[]') == []
+    assert extract_values('[]') == ''
+    assert list(iter_records('[]', ['name'])) == []
+
+
+def test_extract_values():
+    assert extract_values(CAST) == "Tom Hanks|Tim O'Reilly|Don 'D' Rickles"
+    assert extract_values(CAST, key='order', sep=',') == '0,1,2'
+    # 缺少 key 的字典跳过
+    assert extract_values(CAST, key='adult') == 'True'
+
+
+@pytest.mark.parametrize('limit, expected', [
+    (0, ''),
+    (1, 'Tom Hanks'),
+    (2, "Tom Hanks|Tim O'Reilly"),
+    (3, "Tom Hanks|Tim O'Reilly|Don 'D' Rickles"),
+    (10, "Tom Hanks|Tim O'Reilly|Don 'D' Rickles"),
+])
+def test_extract_values_limit(limit, expected):
+    assert extract_values(CAST, limit=limit) == expected
+
+
+def test_extract_values_where():
+    assert extract_values(CREW, where=('job', 'Director')) == 'John Lasseter|Lee Unkrich'
+    assert extract_values(CREW, where=('job', 'Producer')) == ''
+    assert extract_values(CREW, where=('job', 'Director'), limit=2) == 'John Lasseter'
+    # 条件可以是非字符串的值
+    assert extract_values(CAST, where=('order', 1)) == "Tim O'Reilly"
+    assert extract_values(CAST, where=('profile_path', None)) == 'Tom Hanks'
+
+
+def test_iter_records():
+    assert list(iter_records(CAST, ['name', 'adult'])) == [
+        ('Tom Hanks', None), ("Tim O'Reilly", True), ("Don 'D' Rickles", None)]
+
+
+def test_columns_keep_index_and_empty_cells():
+    series = pd.Series([CREW, np.nan, '[]', "[{'name': 'Pixar'}]"], index=[10, 20, 30, 40])
+    joined = join_column(series, where=('job', 'Director'))
+    assert joined.index.tolist() == [10, 20, 30, 40]
+    assert joined.tolist() == ['John Lasseter|Lee Unkrich', '', '', '']
+    assert join_column(series).tolist() == ['John Lasseter|Joss Whedon|Lee Unkrich', '', '', 'Pixar']
+
+    parsed = parse_column(series, fields=['name'])
+    assert parsed.index.tolist() == [10, 20, 30, 40]
+    assert parsed[10] == [{'name': 'John Lasseter'}, {'name': 'Joss Whedon'}, {'name': 'Lee Unkrich'}]
+    # 空值保持原值
+    assert pd.isna(parsed[20]) and parsed[30] == [] and parsed[40] == [{'name': 'Pixar'}]
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+
+from benchmark import write_dataset
+from dataProcessing import handle_keywords, run_pipeline
+from normalizedStore import NormalizedStore
+
+
+def joined(frame, column):
+    return frame.groupby('movie_id')[column].agg(lambda values: '|'.join(values))
+
+
+def test_run_pipeline_writes_normalized_store(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    write_dataset(data_dir, 300, ratings=0, malformed_rate=0.02)
+    keywords_filepath = str(tmp_path / 'keywords.csv')
+    handle_keywords(os.path.join(data_dir, 'keywords.csv'), keywords_filepath)
+    movies_filepath = str(tmp_path / 'movies.csv')
+    store_filepath = str(tmp_path / 'credits_store.npz')
+
+    run_pipeline(os.path.join(data_dir, 'movies_metadata.csv'), os.path.join(data_dir, 'credits.csv'),
+                 movies_filepath, str(tmp_path / 'poster_path.csv'), ratings_files=(),
+                 keywords_filepath=keywords_filepath, quarantine_filepath=str(tmp_path / 'quarantine.csv'),
+                 store_filepath=store_filepath)
+
+    store = NormalizedStore.load(store_filepath)
+    movies = pd.read_csv(movies_filepath, dtype={'actor': str, 'director': str}).set_index('id')
+    cast = store.to_frame('cast')
+    crew = store.to_frame('crew')
+    # 规范化存储与 movies.csv 中'|'分隔的演员、导演内容一致，异常行不进入存储
+    assert set(cast['movie_id']) <= set(movies.index)
+    actors = joined(cast, 'person')
+    pd.testing.assert_series_equal(actors, movies['actor'].dropna().loc[actors.index], check_names=False, check_index_type=False)
+    directors = joined(crew, 'person')
+    pd.testing.assert_series_equal(directors, movies['director'].dropna().loc[directors.index], check_names=False, check_index_type=False)
+
+    keywords = pd.read_csv(keywords_filepath, dtype={'movieId': str})
+    keywords = keywords[keywords['movieId'].str.isdigit()]
+    stored_keywords = store.to_frame('keywords')
+    assert stored_keywords['keyword'].tolist() == keywords['tag'].tolist()
+    assert stored_keywords['keyword_id'].tolist() == keywords['userId'].tolist()
+
+
+def test_crew_filter_does_not_store_unused_terms():
+    crew = [{'name': 'The Director', 'job': 'Director'}] + [{'name': f"Grip {i}", 'job': 'Grip'} for i in range(1000)]
+    cast = [{'name': f"Actor {i}", 'character': f"Role {i}"} for i in range(20)]
+    credits = pd.DataFrame({'id': [1], 'cast': [str(cast)], 'crew': [str(crew)]})
+
+    store = NormalizedStore()
+    store.add_credits(credits, cast_limit=15, crew_jobs=['Director'])
+
+    referenced = set(store.edges['cast']['person']) | set(store.edges['crew']['person'])
+    assert len(store.edges['crew']['person']) == 1
+    assert len(store.dictionaries['person']) == len(referenced) == 16
+    assert store.dictionaries['job'].terms == ['Director']
+    assert len(store.dictionaries['character']) == 15
+    assert store.to_frame('crew')['person'].tolist() == ['The Director']
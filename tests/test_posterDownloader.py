@@ -0,0 +1,77 @@
+import os
+
+import pandas as pd
+
+from posterDownloader import PosterDownloader, download_posters
+
+
+def write_posters(filepath, rows):
+    pd.DataFrame(rows, columns=['id', 'poster_path']).to_csv(filepath, index=False)
+
+
+def read_file(filepath):
+    with open(filepath, 'rb') as file:
+        return file.read()
+
+
+def test_download_skip_and_revalidate(stub_server, tmp_path):
+    stub_server.route('/img/w500/a.jpg', b'image a' * 1000, headers={'ETag': '"a1"'})
+    stub_server.route('/img/w500/b.jpg', b'image b', headers={'ETag': '"b1"'})
+    poster_filepath = str(tmp_path / 'poster_path.csv')
+    write_posters(poster_filepath, [(1, '/a.jpg'), (2, '/b.jpg'), (3, '/a.jpg'), (4, None)])
+    output_dir = str(tmp_path / 'posters')
+    index_filepath = str(tmp_path / 'poster_files.csv')
+    base_url = f"{stub_server.url}/img"
+
+    summary = download_posters(poster_filepath, output_dir, 'w500', base_url, index_filepath, chunk_size=512)
+    assert summary['downloaded'] == 2 and summary['bytes'] == 7000 + 7
+    index = pd.read_csv(index_filepath)
+    assert index['id'].tolist() == [1, 2, 3]
+    assert read_file(os.path.join(output_dir, index['path'][0])) == b'image a' * 1000
+    assert not any(name.endswith('.part') for name in os.listdir(os.path.join(output_dir, 'w500')))
+
+    # 已下载的图片直接跳过，不发出请求
+    stub_server.requests.clear()
+    summary = download_posters(poster_filepath, output_dir, 'w500', base_url)
+    assert summary['skipped'] == 2 and summary['downloaded'] == 0
+    assert stub_server.paths() == []
+
+    # revalidate 时带上 ETag：未变化的返回 304，变化的重新下载
+    stub_server.route('/img/w500/b.jpg', b'image b v2', headers={'ETag': '"b2"'})
+    summary = download_posters(poster_filepath, output_dir, 'w500', base_url, revalidate=True)
+    assert summary['not_modified'] == 1 and summary['downloaded'] == 1
+    assert {headers.get('If-None-Match') for _, headers in stub_server.requests} == {'"a1"', '"b1"'}
+    assert read_file(os.path.join(output_dir, index['path'][1])) == b'image b v2'
+
+
+def test_same_file_name_from_different_urls(stub_server, tmp_path):
+    stub_server.route('/img/original/poster.jpg', b'first', headers={'ETag': '"1"'})
+    stub_server.route('/other/poster.jpg', b'second', headers={'ETag': '"2"'})
+    output_dir = str(tmp_path / 'posters')
+    downloader = PosterDownloader(output_dir, base_url=f"{stub_server.url}/img")
+    try:
+        summary = downloader.download_all(['/poster.jpg', f"{stub_server.url}/other/poster.jpg"])
+        first = downloader.local_path(f"{stub_server.url}/img/original/poster.jpg")
+        second = downloader.local_path(f"{stub_server.url}/other/poster.jpg")
+    finally:
+        downloader.close()
+
+    assert summary['downloaded'] == 2
+    assert first != second
+    assert read_file(first) == b'first' and read_file(second) == b'second'
+
+
+def test_download_retries_interrupted_stream(stub_server, tmp_path):
+    # 第一次响应只发出一半的内容就断开连接
+    truncated = {'Content-Length': '14000', 'Connection': 'close'}
+    stub_server.route_sequence('/img/w500/a.jpg', [(200, truncated, b'image a' * 1000),
+                                                   (200, {}, b'image a' * 2000)])
+    downloader = PosterDownloader(str(tmp_path / 'posters'), 'w500', f"{stub_server.url}/img", backoff=0)
+    try:
+        entry = downloader.download(f"{stub_server.url}/img/w500/a.jpg")
+    finally:
+        downloader.close()
+
+    assert stub_server.paths() == ['/img/w500/a.jpg'] * 2
+    assert entry['bytes'] == 14000
+    assert read_file(os.path.join(str(tmp_path / 'posters'), entry['path'])) == b'image a' * 2000
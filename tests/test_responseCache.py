@@ -0,0 +1,70 @@
+import responseCache
+from responseCache import ResponseCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(responseCache.time, 'time', clock)
+    return ResponseCache(str(tmp_path / 'cache.sqlite'), **kwargs), clock
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, ttl=60)
+    with cache:
+        cache.put(1, 'zh-CN', {'title': '玩具总动员'})
+        clock.now += 60
+        assert cache.get(1, 'zh-CN') == {'title': '玩具总动员'}
+        # 语言不同的记录互不影响
+        assert cache.get(1, 'en-US') is None
+        clock.now += 1
+        assert cache.get(1, 'zh-CN') is None
+
+        # 重新写入后有效期重新计算
+        cache.put(1, 'zh-CN', {'title': 'Toy Story'})
+        assert cache.get(1, 'zh-CN') == {'title': 'Toy Story'}
+
+
+def test_eviction_removes_least_recently_used_down_to_low_water_mark(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, max_entries=10)
+    with cache:
+        for movie_id in range(10):
+            clock.now += 1
+            cache.put(movie_id, 'zh-CN', {'id': movie_id})
+        # 访问最早写入的两条，使它们成为最近使用的记录
+        for movie_id in (0, 1):
+            clock.now += 1
+            assert cache.get(movie_id, 'zh-CN') == {'id': movie_id}
+        assert cache.stats()['entries'] == 10
+
+        clock.now += 1
+        cache.put(10, 'zh-CN', {'id': 10})
+        # 超过上限后降到上限的90%：删除最久未使用的 2..3
+        assert cache.stats()['entries'] == 9
+        kept = [movie_id for movie_id in range(11) if cache.get(movie_id, 'zh-CN') is not None]
+        assert kept == [0, 1, 4, 5, 6, 7, 8, 9, 10]
+
+
+def test_hit_and_miss_counters(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch)
+    with cache:
+        assert cache.stats() == {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'entries': 0}
+        assert cache.get(1, 'zh-CN') is None
+        cache.put(1, 'zh-CN', {'id': 1})
+        cache.get(1, 'zh-CN')
+        cache.get(1, 'zh-CN')
+        cache.get(2, 'zh-CN')
+        assert cache.stats() == {'hits': 2, 'misses': 2, 'hit_rate': 0.5, 'entries': 1}
+
+    # 记录保存在文件中，重新打开后仍然存在，计数从0开始
+    with ResponseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        assert cache.stats()['entries'] == 1
+        assert cache.get(1, 'zh-CN') == {'id': 1}
+        assert cache.stats()['hits'] == 1
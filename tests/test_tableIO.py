@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from tableIO import ChunkWriter, read_table
+
+
+def chunks():
+    first = pd.DataFrame({'id': pd.array([1, 2, None], dtype='Int32'), 'status': pd.Categorical(['Released'] * 3),
+                          'genres': ['Drama', 'Drama', None], 'budget': ['10', '10', '10'],
+                          'title': ['a', 'b', 'c'], 'empty': [None, None, None]})
+    second = pd.DataFrame({'id': pd.array([4, 5, 6], dtype='Int32'), 'status': pd.Categorical(['Rumored', None, 'Released']),
+                           'genres': ['Comedy', 'Drama', 'Comedy'], 'budget': ['1', '2', 'x'],
+                           'title': ['d', 'e', 'f'], 'empty': ['g', None, None]})
+    return first, second
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'arrow'])
+def test_chunk_writer_dictionary_encodes_with_one_schema(tmp_path, extension):
+    filepath = str(tmp_path / f"movies.{extension}")
+    first, second = chunks()
+    with ChunkWriter(filepath) as writer:
+        writer.write(first)
+        writer.write(second)
+
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    schema = writer.schema
+    assert schema.field('status').type == dictionary
+    assert schema.field('genres').type == dictionary
+    # 数字字符串和第一块全为空的列不做字典编码
+    assert schema.field('budget').type == pa.string()
+    assert schema.field('empty').type == pa.string()
+    assert schema.field('id').type == pa.int32()
+
+    result = read_table(filepath)
+    expected = pd.concat([first, second], ignore_index=True)
+    assert str(result['id'].dtype) == 'Int32'
+    for column in ('status', 'genres', 'budget', 'empty'):
+        assert result[column].astype(object).fillna('').tolist() == expected[column].astype(object).fillna('').tolist()
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'arrow'])
+def test_chunk_writer_all_null_categorical_first_chunk(tmp_path, extension):
+    filepath = str(tmp_path / f"status.{extension}")
+    with ChunkWriter(filepath) as writer:
+        writer.write(pd.DataFrame({'status': pd.Categorical([None, None])}))
+        writer.write(pd.DataFrame({'status': pd.Categorical(['Released', 'Rumored'])}))
+
+    assert writer.schema.field('status').type == pa.string()
+    assert read_table(filepath)['status'].tolist()[2:] == ['Released', 'Rumored']
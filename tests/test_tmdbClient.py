@@ -0,0 +1,71 @@
+import json
+import time
+
+import pytest
+import requests
+
+from tmdbClient import Checkpoint, TMDBClient
+
+
+def read_lines(filepath):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_checkpoint_truncates_partial_last_line(tmp_path):
+    filepath = tmp_path / 'run.checkpoint'
+    filepath.write_text('{"id": "1", "data": null}\n{"id": "2", "data": null}\n{"id": "3", "da', encoding='utf-8')
+
+    with Checkpoint(str(filepath)) as checkpoint:
+        assert '1' in checkpoint and '2' in checkpoint and '3' not in checkpoint
+        checkpoint.mark('4')
+
+    assert [entry['id'] for entry in read_lines(filepath)] == ['1', '2', '4']
+    with Checkpoint(str(filepath)) as checkpoint:
+        assert set(checkpoint.done) == {'1', '2', '4'}
+
+
+def make_client(server, **kwargs):
+    options = {'concurrency': 2, 'rate': 1000, 'max_retries': 2, 'backoff': 0, 'timeout': 5, **kwargs}
+    return TMDBClient('key', base_url=server.url, **options)
+
+
+def test_get_retries_429_with_retry_after(stub_server):
+    stub_server.route_sequence('/movie/1', [
+        (429, {'Retry-After': '0'}, b'{}'),
+        (200, {'Content-Type': 'application/json'}, b'{"id": 1, "title": "Toy Story"}'),
+    ])
+    client = make_client(stub_server)
+    try:
+        assert client.get_movie(1) == {'id': 1, 'title': 'Toy Story'}
+        assert client.retries == 1
+    finally:
+        client.close()
+    assert stub_server.paths() == ['/movie/1', '/movie/1']
+
+
+def test_get_raises_after_max_retries(stub_server):
+    stub_server.route('/movie/2', b'{}', status=500)
+    client = make_client(stub_server, max_retries=2)
+    try:
+        with pytest.raises(requests.HTTPError) as error:
+            client.get_movie(2)
+    finally:
+        client.close()
+    assert error.value.response.status_code == 500
+    assert client.retries == 2
+    assert len(stub_server.paths()) == 3
+
+
+def test_token_bucket_limits_request_rate(stub_server):
+    stub_server.route('/movie/3', b'{}', headers={'Content-Type': 'application/json'})
+    # 每秒5个请求，突发5个：前5个立即发出，后5个至少还要等待约1秒
+    client = make_client(stub_server, rate=5)
+    try:
+        start = time.monotonic()
+        for _ in range(10):
+            client.get_movie(3)
+        elapsed = time.monotonic() - start
+    finally:
+        client.close()
+    assert elapsed >= 0.9
@@ -0,0 +1,273 @@
+import concurrent.futures
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import increment, observe
+
+# 请求 TMDB 接口的客户端：所有请求共用一个带连接池的 Session，
+# 用令牌桶限制请求速率，遇到 429 和 5xx 时按指数退避重试
+
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+
+# 需要重试的状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 需要重试的异常：连接错误、超时，以及读取响应体时连接中断（流式下载时可能发生在中途）
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+# 是否为可以重试的错误：RETRY_EXCEPTIONS 中的异常，或状态码在 RETRY_STATUS 中的 HTTPError
+def is_retryable(error):
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUS
+    return isinstance(error, RETRY_EXCEPTIONS)
+
+
+# 第 attempt 次重试前需要等待的时间：backoff * 2**attempt 加上随机抖动，429 响应带 Retry-After 时以它为准
+def retry_delay(backoff, attempt, response=None):
+    if response is not None and response.headers.get('Retry-After'):
+        try:
+            return float(response.headers['Retry-After'])
+        except ValueError:
+            pass
+    return backoff * 2 ** attempt * (1 + random.random() * 0.1)
+
+
+def call_with_retries(attempt, max_retries, backoff, limiter=None, on_retry=None):
+    """
+    调用 attempt() 直到成功，返回它的结果。
+
+    attempt 发出一次请求，需要重试时抛出 is_retryable 的异常（例如 response.raise_for_status() 抛出的 429/5xx），
+    其他异常直接抛出。重试次数用完后抛出最后一次的异常。
+
+    参数：
+    - max_retries: int
+        最大重试次数。
+    - backoff: float
+        见 retry_delay。
+    - limiter: TokenBucket, 可选
+        每次请求之前取一个令牌。
+    - on_retry: 可调用对象, 可选
+        每次重试之前以 (第几次, 异常) 调用，用于统计。
+    """
+    for attempt_number in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return attempt()
+        except (requests.HTTPError, *RETRY_EXCEPTIONS) as e:
+            if not is_retryable(e) or attempt_number == max_retries:
+                raise
+            if on_retry is not None:
+                on_retry(attempt_number, e)
+            time.sleep(retry_delay(backoff, attempt_number, getattr(e, 'response', None)))
+
+
+def run_bounded(executor, func, items, max_in_flight):
+    """
+    用 executor 对每个 item 执行 func(item)，同时在途的任务不超过 max_in_flight 个，
+    按完成顺序逐个返回 (item, future)。items 按需读取，不会一次提交所有任务，内存占用与 items 的数量无关。
+    """
+    items = iter(items)
+    in_flight = {}
+    while True:
+        # 补充在途任务
+        for item in items:
+            in_flight[executor.submit(func, item)] = item
+            if len(in_flight) >= max_in_flight:
+                break
+        if not in_flight:
+            return
+        finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in finished:
+            yield in_flight.pop(future), future
+
+
+class TokenBucket:
+    """
+    令牌桶限速器，线程安全。
+
+    参数：
+    - rate: float
+        每秒补充的令牌数，即平均每秒最多发出的请求数。
+    - capacity: int, 可选
+        桶的容量，即允许的突发请求数，默认等于 rate。
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # 取一个令牌，没有令牌时等待
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TMDBClient:
+    """
+    参数：
+    - api_key: str
+        TMDB 的 api_key。
+    - base_url: str, 可选
+        接口地址，测试时可以指向本地的模拟服务器。
+    - language: str, 可选
+        返回数据的语言。
+    - concurrency: int, 可选
+        并发请求数，同时也是连接池的大小。
+    - rate: float, 可选
+        每秒最多发出的请求数。
+    - max_retries: int, 可选
+        遇到 429/5xx 或连接错误时的最大重试次数。
+    - backoff: float, 可选
+        第 n 次重试前等待 backoff * 2**n 秒（加上随机抖动），429 响应带 Retry-After 时以它为准。
+    - timeout: float, 可选
+        单个请求的超时时间（秒）。
+    - cache: ResponseCache, 可选
+        电影数据的本地缓存，get_movie 先查缓存，缓存中没有或已过期时才请求接口。
+    """
+
+    def __init__(self, api_key, base_url=TMDB_BASE_URL, language='zh-CN', concurrency=30, rate=40,
+                 max_retries=5, backoff=0.5, timeout=10, cache=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.language = language
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate)
+        self.cache = cache
+
+        # 重试由客户端自己处理，连接池大小与并发数一致，所有线程复用连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def count_retry(self, attempt, error):
+        with self.lock:
+            self.retries += 1
+        increment('tmdb.retries')
+
+    # 发送 GET 请求，返回解析后的 json；重试次数用完后抛出最后一次的异常
+    def get(self, path, **params):
+        params = {'api_key': self.api_key, 'language': self.language, **params}
+        url = f"{self.base_url}/{path.lstrip('/')}"
+
+        def attempt():
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except RETRY_EXCEPTIONS as e:
+                observe('tmdb.request_seconds', time.perf_counter() - start)
+                increment(f"tmdb.{type(e).__name__}")
+                raise
+            observe('tmdb.request_seconds', time.perf_counter() - start)
+            increment(f"tmdb.status.{response.status_code}")
+            response.raise_for_status()
+            return response.json()
+
+        try:
+            return call_with_retries(attempt, self.max_retries, self.backoff, self.limiter, self.count_retry)
+        except Exception as e:
+            if is_retryable(e):
+                increment('tmdb.failures')
+            raise
+
+    def get_movie(self, movie_id):
+        if self.cache is not None:
+            movie_data = self.cache.get(movie_id, self.language)
+            if movie_data is not None:
+                increment('tmdb.cache_hits')
+                return movie_data
+            increment('tmdb.cache_misses')
+        movie_data = self.get(f"movie/{movie_id}")
+        if self.cache is not None:
+            self.cache.put(movie_id, self.language, movie_data)
+        return movie_data
+
+    def close(self):
+        self.session.close()
+
+
+# 把文件截断到最后一个完整的行：中断时最后一行可能只写了一半，之后追加的内容不会接在半行后面
+def truncate_partial_line(filepath):
+    if not os.path.exists(filepath):
+        return
+    with open(filepath, 'rb+') as file:
+        content = file.read()
+        end = content.rfind(b'\n') + 1
+        if end < len(content):
+            file.truncate(end)
+
+
+class Checkpoint:
+    """
+    记录已经完成的电影 id，每完成一个就追加一行 json 到文件，程序中断后重新运行时跳过这些 id。
+
+    每行的格式为 {"id": ..., "data": ...}，data 为该 id 的结果（没有结果时为 null）。
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.done = {}
+        self.lock = threading.Lock()
+        if os.path.exists(filepath):
+            truncate_partial_line(filepath)
+            with open(filepath, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.done[str(entry['id'])] = entry.get('data')
+        self.file = open(filepath, 'a', encoding='utf-8')
+
+    def __contains__(self, movie_id):
+        return str(movie_id) in self.done
+
+    def mark(self, movie_id, data=None):
+        self.mark_many([movie_id], [data])
+
+    # 一次记录多个id，只刷新一次文件
+    def mark_many(self, movie_ids, data=None):
+        data = data if data is not None else [None] * len(movie_ids)
+        with self.lock:
+            for movie_id, entry in zip(movie_ids, data):
+                self.done[str(movie_id)] = entry
+                self.file.write(json.dumps({'id': str(movie_id), 'data': entry}, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    # 之前运行中已经得到的结果
+    def records(self):
+        return [data for data in self.done.values() if data is not None]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()